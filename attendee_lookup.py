@@ -0,0 +1,143 @@
+import functools
+import unicodedata
+
+
+# Champs cherchés par le filtre des participants. La position est gardée pour que le filtre trouve aussi les rôles.
+SEARCH_FIELDS = ["first_name", "last_name", "company", "email", "position"]
+GRAM_SIZE = 3
+# Recherche approximative : part minimale des trigrammes de la requête qu'un participant doit avoir.
+FUZZY_THRESHOLD = 0.5
+
+EMPTY = frozenset()
+
+
+# Prénoms et compagnies se répètent beaucoup d'un participant à l'autre.
+@functools.lru_cache(maxsize=65536)
+def normalize(text):
+	# Sans accents ni majuscules : « Hélène » et « HELENE » donnent « helene ».
+	if text.isascii():
+		return text.casefold()
+	decomposed = unicodedata.normalize("NFKD", text)
+	return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+def word_grams(word):
+	return {word[i:i + GRAM_SIZE] for i in range(len(word) - GRAM_SIZE + 1)}
+
+def text_grams(text):
+	return {word[i:i + GRAM_SIZE] for word in text.split() for i in range(len(word) - GRAM_SIZE + 1)}
+
+
+class AttendeeLookup:
+	# Code-barres -> ID en O(1), et index de trigrammes sans accents pour la recherche pendant la frappe.
+	# L'index est construit à la première recherche, puis tenu à jour participant par participant.
+	def __init__(self):
+		self.clear()
+
+	def clear(self):
+		self.ready = False
+		self.by_barcode = {}
+		self.barcodes = {}
+		self.texts = {}
+		self.grams = {}
+
+	def rebuild(self, attendees):
+		self.clear()
+		self.ready = True
+		for att in attendees:
+			self.add(att)
+
+	# Aussi appelé quand un participant change : seuls les trigrammes qui diffèrent de son ancienne entrée sont touchés.
+	def add(self, att):
+		if not self.ready:
+			return
+		att_id = att.attendee_id
+		text = "\t".join(normalize(att[field]) for field in SEARCH_FIELDS)
+		old_text = self.texts.get(att_id)
+		if text != old_text:
+			self.texts[att_id] = text
+			new_grams = text_grams(text)
+			old_grams = text_grams(old_text) if old_text is not None else EMPTY
+			self.remove_grams(att_id, old_grams - new_grams)
+			grams = self.grams
+			for gram in new_grams - old_grams:
+				ids = grams.get(gram)
+				if ids is None:
+					grams[gram] = {att_id}
+				else:
+					ids.add(att_id)
+		if att.barcode != self.barcodes.get(att_id):
+			self.remove_barcode(att_id)
+			if att.barcode:
+				self.by_barcode[att.barcode] = att_id
+				self.barcodes[att_id] = att.barcode
+
+	def remove(self, att_id):
+		text = self.texts.pop(att_id, None)
+		if text is not None:
+			self.remove_grams(att_id, text_grams(text))
+		self.remove_barcode(att_id)
+
+	def remove_grams(self, att_id, grams):
+		for gram in grams:
+			ids = self.grams[gram]
+			ids.discard(att_id)
+			if not ids:
+				del self.grams[gram]
+
+	def remove_barcode(self, att_id):
+		barcode = self.barcodes.pop(att_id, None)
+		if barcode is not None and self.by_barcode.get(barcode) == att_id:
+			del self.by_barcode[barcode]
+
+	def find_barcode(self, barcode):
+		return self.by_barcode.get(barcode.strip())
+
+	def search(self, query, fuzzy=True):
+		# Retourne l'ensemble des IDs dont les champs contiennent chaque mot de la requête.
+		query = query.strip()
+		# Une douchette envoie le code-barres complet, et un ID exact ne peut désigner qu'un participant.
+		exact_id = self.by_barcode.get(query) or (query if query in self.texts else None)
+		if exact_id is not None:
+			return {exact_id}
+		words = normalize(query).split()
+		if not words:
+			return set(self.texts)
+		candidates = None
+		verify = []
+		# Les mots les plus longs d'abord, ils ont les listes les plus courtes.
+		for word in sorted(words, key=len, reverse=True):
+			if len(word) < GRAM_SIZE:
+				verify.append(word)
+				continue
+			postings = sorted((self.grams.get(gram, EMPTY) for gram in word_grams(word)), key=len)
+			ids = postings[0].intersection(*postings[1:])
+			candidates = ids if candidates is None else candidates & ids
+			# Un mot d'un seul trigramme est forcément contenu dans le texte, les autres sont à vérifier.
+			if len(word) > GRAM_SIZE:
+				verify.append(word)
+			if not candidates:
+				break
+		texts = self.texts
+		if candidates is None:
+			# Seulement des mots d'une ou deux lettres : pas de trigramme, on parcourt tout.
+			candidates = texts
+		matches = candidates
+		for word in verify:
+			matches = {att_id for att_id in matches if word in texts[att_id]}
+		if not matches and fuzzy:
+			return self.search_fuzzy(words)
+		return set(matches)
+
+	def search_fuzzy(self, words):
+		# Tolère les fautes de frappe : assez de trigrammes en commun avec la requête suffit.
+		grams = set()
+		for word in words:
+			grams.update(word_grams(word))
+		if not grams:
+			return set()
+		scores = {}
+		for gram in grams:
+			for att_id in self.grams.get(gram, EMPTY):
+				scores[att_id] = scores.get(att_id, 0) + 1
+		minimum = max(2, len(grams) * FUZZY_THRESHOLD)
+		return {att_id for att_id, score in scores.items() if score >= minimum}
@@ -0,0 +1,139 @@
+from PySide6.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PySide6.QtWidgets import QStyledItemDelegate, QComboBox
+
+
+# Les attributs d'enum de Qt sont lents à résoudre en PySide6, et data() est appelée des centaines de milliers de fois.
+DisplayRole = Qt.DisplayRole
+EditRole = Qt.EditRole
+Horizontal = Qt.Horizontal
+ItemIsEditable = Qt.ItemIsEditable
+DescendingOrder = Qt.DescendingOrder
+
+PRINT_STATUS_LABELS = ["Oui", "Non", "Exclu"]
+
+
+class AttendeeTableModel(QAbstractTableModel):
+	# (champ du dataclass Attendee, en-tête de colonne)
+	COLUMNS = [
+		("attendee_id", "ID Eventbrite"),
+		("first_name", "Prénom"),
+		("last_name", "Nom"),
+		("position", "Rôle"),
+		("company", "Compagnie"),
+		("printing_status", "Imprimé?"),
+	]
+	STATUS_COLUMN = 5
+
+	def __init__(self, eventbrite, parent=None):
+		super().__init__(parent)
+		# On lit toujours eventbrite.attendees, le dict peut être remplacé (connexion, chargement de session).
+		self.eventbrite = eventbrite
+		self.attendee_ids = []
+		self.rows_by_id = {}
+		self.sort_column = -1
+		self.sort_order = Qt.AscendingOrder
+		self.filter_text = ""
+
+	def refresh(self):
+		self.beginResetModel()
+		if self.filter_text:
+			# L'index de recherche donne directement les rangées à montrer, sans tester chaque rangée une à une.
+			self.attendee_ids = list(self.eventbrite.search_attendees(self.filter_text))
+		else:
+			self.attendee_ids = list(self.eventbrite.attendees.keys())
+		self.sort_ids()
+		self.endResetModel()
+
+	def set_filter_text(self, text):
+		# Une rangée modifiée reste affichée jusqu'au prochain changement du filtre, même si elle ne correspond plus.
+		self.filter_text = text.strip()
+		self.refresh()
+
+	def attendees_changed(self, attendee_ids):
+		# Rafraîchir seulement les rangées touchées, sans reconstruire le modèle. Un seul signal pour la plage qui les couvre.
+		rows = [self.rows_by_id[att_id] for att_id in attendee_ids if att_id in self.rows_by_id]
+		if rows:
+			self.dataChanged.emit(self.index(min(rows), 0), self.index(max(rows), len(self.COLUMNS) - 1))
+
+	def attendee_at(self, row):
+		return self.eventbrite.attendees.get(self.attendee_ids[row])
+
+	def rowCount(self, parent=QModelIndex()):
+		return 0 if parent.isValid() else len(self.attendee_ids)
+
+	def columnCount(self, parent=QModelIndex()):
+		return 0 if parent.isValid() else len(self.COLUMNS)
+
+	def headerData(self, section, orientation, role=DisplayRole):
+		if orientation == Horizontal and role == DisplayRole:
+			return self.COLUMNS[section][1]
+		return None
+
+	def data(self, index, role=DisplayRole):
+		if (role != DisplayRole and role != EditRole) or not index.isValid():
+			return None
+		att = self.attendee_at(index.row())
+		# L'attendee peut avoir disparu si le dict a été remplacé avant le prochain refresh.
+		if att is None:
+			return None
+		column = index.column()
+		value = att[self.COLUMNS[column][0]]
+		if column == self.STATUS_COLUMN:
+			return PRINT_STATUS_LABELS[value] if role == DisplayRole else int(value)
+		return value.strip() if role == DisplayRole else value
+
+	def setData(self, index, value, role=EditRole):
+		if not index.isValid() or role != EditRole:
+			return False
+		att = self.attendee_at(index.row())
+		if att is None:
+			return False
+		# Les modifications sont écrites directement dans l'objet Attendee, via EventbriteManager pour garder son index à jour.
+		if index.column() == self.STATUS_COLUMN:
+			self.eventbrite.set_printing_status(att.attendee_id, int(value))
+		else:
+			self.eventbrite.set_attendee_value(att.attendee_id, self.COLUMNS[index.column()][0], str(value))
+		self.dataChanged.emit(index, index, [role])
+		return True
+
+	def flags(self, index):
+		flags = super().flags(index)
+		# Le ID reste en lecture seule, vu que briserait trop de chose de le laisser éditable.
+		if index.isValid() and index.column() != 0:
+			flags |= ItemIsEditable
+		return flags
+
+	def sort_ids(self):
+		if self.sort_column >= 0:
+			field = self.COLUMNS[self.sort_column][0]
+			attendees = self.eventbrite.attendees
+			self.attendee_ids.sort(key=lambda att_id: attendees[att_id][field], reverse=self.sort_order == DescendingOrder)
+		self.rows_by_id = {att_id: row for row, att_id in enumerate(self.attendee_ids)}
+
+	def sort(self, column, order=Qt.AscendingOrder):
+		# Trier la liste d'IDs en Python plutôt que de laisser un QSortFilterProxyModel comparer les cellules une à une.
+		self.layoutAboutToBeChanged.emit()
+		old_indexes = self.persistentIndexList()
+		old_ids = [self.attendee_ids[index.row()] for index in old_indexes]
+		self.sort_column = column
+		self.sort_order = order
+		self.sort_ids()
+		new_indexes = [self.index(self.rows_by_id[att_id], index.column()) for att_id, index in zip(old_ids, old_indexes)]
+		self.changePersistentIndexList(old_indexes, new_indexes)
+		self.layoutChanged.emit()
+
+
+class PrintStatusDelegate(QStyledItemDelegate):
+	# Un combo box est créé seulement pendant l'édition, plutôt qu'un widget par rangée.
+	def createEditor(self, parent, option, index):
+		editor = QComboBox(parent)
+		editor.addItems(PRINT_STATUS_LABELS)
+		editor.activated.connect(lambda: self.commitData.emit(editor))
+		return editor
+
+	def setEditorData(self, editor, index):
+		editor.setCurrentIndex(index.data(EditRole))
+
+	def setModelData(self, editor, model, index):
+		model.setData(index, editor.currentIndex(), EditRole)
+
@@ -0,0 +1,194 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+
+# Seulement des modules sans Qt : ce mode doit rouler sur un serveur sans affichage.
+from utils import *
+from eventbrite_manager import EventbriteManager, PrintStatus
+from nametag_generator import NametagGenerator, TemplateVariableValue
+from session_store import SessionStore, DEFAULT_SESSION_PATH
+from instrumentation import metrics, profile_to
+from watch import WatchPipeline, WebhookServer
+
+
+def parse_args(argv=None):
+	parser = argparse.ArgumentParser(description="Génération des cocardes en lot, sans interface graphique")
+	parser.add_argument("--session", default=DEFAULT_SESSION_PATH, help="session à charger et à mettre à jour")
+	parser.add_argument("--no-session", action="store_true", help="ne pas charger ni sauvegarder de session")
+	parser.add_argument("--api-key", help="clé d'API Eventbrite (par défaut celle de la session)")
+	parser.add_argument("--api-url", help="URL de l'API Eventbrite (serveur local pour les tests)")
+	parser.add_argument("--event", nargs="+", help="ID des événements à télécharger, plusieurs pour une cocarde par personne (par défaut ceux de la session)")
+	parser.add_argument("--sync", action="store_true", help="synchroniser les participants avec Eventbrite avant de générer")
+	parser.add_argument("--full-sync", action="store_true", help="tout retélécharger plutôt que seulement les participants modifiés")
+	parser.add_argument("--overwrite", action="store_true", help="lors de la synchro, les changements d'Eventbrite remplacent aussi les champs modifiés localement")
+	parser.add_argument("--template", help="gabarit Word (par défaut celui de la session)")
+	parser.add_argument("--context", help="fichier JSON des variables du gabarit, {variable: [est_un_champ, valeur]}")
+	parser.add_argument("--steps", nargs="*", help="étapes de rendu personnalisées, par exemple add_qr_code")
+	parser.add_argument("--output", default="output", help="dossier des cocardes générées")
+	parser.add_argument("--merged", action="store_true", help="regrouper les cocardes dans quelques gros documents")
+	parser.add_argument("--batch-size", type=int, default=100, help="nombre de cocardes par document regroupé")
+	parser.add_argument("--workers", type=int, help="nombre de processus de génération")
+	parser.add_argument("--all", action="store_true", help="générer aussi les cocardes déjà imprimées (sauf exclues)")
+	parser.add_argument("--no-mark-printed", action="store_true", help="ne pas marquer les cocardes générées comme imprimées")
+	parser.add_argument("--metrics", help="exporter les durées par étape à la fin, en JSON ou en CSV selon l'extension")
+	parser.add_argument("--profile", help="profiler la génération avec cProfile dans ce fichier .prof (un seul processus)")
+	parser.add_argument("--watch", action="store_true", help="surveiller les nouvelles inscriptions et envoyer leurs cocardes dans le spool, jusqu'à Ctrl-C")
+	parser.add_argument("--spool", default="spool", help="dossier surveillé par l'imprimante en mode --watch")
+	parser.add_argument("--poll-interval", type=float, default=30, help="secondes entre deux synchros en mode --watch")
+	parser.add_argument("--max-spooled", type=int, default=100, help="cocardes en attente dans le spool avant de suspendre la génération")
+	parser.add_argument("--webhook-port", type=int, help="recevoir aussi les webhooks d'Eventbrite sur ce port en mode --watch")
+	parser.add_argument("--webhook-host", default="127.0.0.1", help="adresse d'écoute des webhooks")
+	return parser.parse_args(argv)
+
+def load_context_file(filepath):
+	with open(filepath, encoding="utf-8") as file:
+		context = json.load(file)
+	return {k: TemplateVariableValue(*v) for k, v in context.items()}
+
+def make_progress_logger():
+	# Un message par tranche de 10 %, pour ne pas inonder le journal d'une nuit complète.
+	last_tenth = -1
+	def log_progress(done, total):
+		nonlocal last_tenth
+		tenth = done * 10 // max(total, 1)
+		if tenth != last_tenth:
+			logging.info(f"Generated {done}/{total} nametags")
+			last_tenth = tenth
+	return log_progress
+
+def generate(nametag_gen, jobs, steps, args, workers):
+	if args.merged:
+		prefix = os.path.join(args.output, f"{format_datetime()}_cocardes")
+		return nametag_gen.generate_merged_nametags(
+			jobs, prefix + "_{:03d}.docx", args.batch_size, steps, workers, make_progress_logger(),
+			index_filepath=prefix + "_index.csv"
+		)
+	return nametag_gen.generate_nametags(jobs, steps, workers, make_progress_logger())
+
+def save_session(store, eventbrite, nametag_gen, steps, session_data):
+	# Garder les réglages de la session, en y ajoutant la clé d'API, le gabarit et ses variables de cette exécution
+	# (comme MainWindow.session_meta), pour qu'un --sync ou un --watch suivant n'ait pas à les redonner.
+	meta = {k: v for k, v in session_data.items() if k != "attendees"}
+	meta.update(eventbrite.session_meta())
+	if eventbrite.api is not None:
+		meta["api_key"] = eventbrite.api.oauth_token
+	meta["nametag_template"] = nametag_gen.doc.template_file
+	meta["template_context"] = nametag_gen.basic_context
+	# L'interface garde l'index de l'étape dans son combo box, où 0 est « Aucune ».
+	custom_steps = nametag_gen.get_custom_render_steps()
+	meta["custom_nametag_step"] = custom_steps.index(steps[0]) + 1 if steps and steps[0] in custom_steps else 0
+	dirty_ids, dirty_payload_ids = eventbrite.take_dirty()
+	store.save(meta, eventbrite.event["id"], eventbrite.attendees, dirty_ids, dirty_payload_ids)
+
+def watch(args, eventbrite, nametag_gen, steps, store, session_data):
+	pipeline = WatchPipeline(
+		eventbrite, nametag_gen, args.spool, steps, args.max_spooled, max_workers=args.workers, overwrite_profiles=args.overwrite
+	)
+	# Sans session, une reprise après plantage réimprimerait tout : la session sert de journal de ce qui est déjà dans le spool.
+	save = (lambda: save_session(store, eventbrite, nametag_gen, steps, session_data)) if store is not None else (lambda: None)
+	webhooks = WebhookServer(pipeline, args.webhook_host, args.webhook_port).start() if args.webhook_port is not None else None
+	logging.info(f"Watching events {', '.join(eventbrite.events)} every {args.poll_interval} s, spooling nametags to {args.spool}")
+	try:
+		pipeline.run(save, args.poll_interval)
+	except KeyboardInterrupt:
+		logging.info("Watch mode stopped")
+	finally:
+		if webhooks is not None:
+			webhooks.stop()
+		save()
+	return 0
+
+def run(args):
+	eventbrite = EventbriteManager()
+	store = None
+	session_data = {}
+	if not args.no_session:
+		mkdir_if_not_there(os.path.dirname(args.session) or ".")
+		store = SessionStore(args.session)
+		session_data = store.load() or {}
+		if session_data:
+			eventbrite.load_session_data(session_data)
+			logging.info(f"Loaded session {args.session} with {len(eventbrite.attendees)} attendees")
+
+	# Réseau seulement si demandé : une session suffit pour générer.
+	event_ids = args.event or list(eventbrite.events)
+	if args.sync or args.event or args.watch:
+		api_key = args.api_key or session_data.get("api_key")
+		if api_key is None or not event_ids:
+			logging.error("An API key and an event are needed to sync with Eventbrite")
+			return 2
+		eventbrite.connect(api_key, args.api_url, reset=False)
+		if eventbrite.user is None or not eventbrite.user.ok:
+			return 1
+		eventbrite.load_events(event_ids, not args.full_sync, args.overwrite)
+	if eventbrite.event is None:
+		logging.error("No event loaded, use --session or --event")
+		return 2
+
+	# Gabarit, variables et étapes : les arguments ont priorité sur la session.
+	template = args.template or session_data.get("nametag_template")
+	if template is None:
+		logging.error("No nametag template, use --template")
+		return 2
+	nametag_gen = NametagGenerator()
+	nametag_gen.qr_cache.disk_dir = "cache/qr"
+	nametag_gen.load_template(template)
+	if args.context is not None:
+		nametag_gen.basic_context = load_context_file(args.context)
+	else:
+		nametag_gen.basic_context = {k: TemplateVariableValue(*v) for k, v in session_data.get("template_context", {}).items()}
+	steps = args.steps
+	if steps is None:
+		# La session garde l'index du combo box, où 0 est « Aucune ».
+		step_index = session_data.get("custom_nametag_step", 0)
+		steps = nametag_gen.get_custom_render_steps()[step_index - 1:step_index] if step_index > 0 else []
+
+	if args.watch:
+		status = watch(args, eventbrite, nametag_gen, steps, store, session_data)
+		if store is not None:
+			store.close()
+		return status
+
+	mkdir_if_not_there(args.output)
+	statuses = (PrintStatus.UNPRINTED, PrintStatus.PRINTED) if args.all else (PrintStatus.UNPRINTED,)
+	# Une cocarde par personne si plusieurs événements sont chargés.
+	jobs = [
+		(att_id, data, os.path.join(args.output, f"{att_id}_nametag.docx"))
+		for att_id, data in eventbrite.nametag_data(statuses)
+	]
+	logging.info(f"Generating {len(jobs)} nametags with template {template} and steps {steps}")
+	start = time.perf_counter()
+	if args.profile is not None:
+		# cProfile ne voit pas les processus de génération, donc tout se fait dans le processus courant.
+		with profile_to(args.profile):
+			results = generate(nametag_gen, jobs, steps, args, 1)
+	else:
+		results = generate(nametag_gen, jobs, steps, args, args.workers)
+	failed = [r for r in results if r.error is not None]
+	for r in failed:
+		logging.error(f"Nametag of attendee {r.attendee_id} failed: {r.error}")
+	logging.info(f"Generated {len(results) - len(failed)} nametags in {time.perf_counter() - start:.1f} s, {len(failed)} errors")
+
+	if not args.no_mark_printed:
+		eventbrite.set_people_printing_status([r.attendee_id for r in results if r.error is None], PrintStatus.PRINTED)
+	if store is not None:
+		save_session(store, eventbrite, nametag_gen, steps, session_data)
+		store.close()
+		logging.info(f"Saved session {args.session}")
+	metrics.log_summary()
+	quota = eventbrite.quota()
+	if quota is not None:
+		logging.info(f"Eventbrite API: {quota['used_last_hour']}/{quota['hourly_limit']} requests in the last hour, {quota['retries']} retries")
+	if args.metrics is not None:
+		metrics.export(args.metrics)
+	return 1 if failed else 0
+
+def main():
+	setup_basic_logging("logs", logging.INFO, logging.DEBUG)
+	sys.exit(run(parse_args()))
+
+if __name__ == "__main__":
+	main()
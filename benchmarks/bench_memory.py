@@ -0,0 +1,50 @@
+import gc
+import json
+import time
+import argparse
+import logging
+import tracemalloc
+
+from eventbrite_manager import EventbriteManager, build_attendees_dict
+from benchmarks.synthetic import make_attendee_objects
+
+
+def run(count):
+	# Les pages arrivent en JSON, donc on repasse par json.loads pour ne pas partager les chaînes du générateur.
+	page = json.dumps(make_attendee_objects(count))
+	manager = EventbriteManager()
+
+	start = time.perf_counter()
+	build_attendees_dict(json.loads(page))
+	elapsed = time.perf_counter() - start
+	print(f"{count} attendees parsed and built in {elapsed:.2f} s")
+
+	# tracemalloc ralentit beaucoup la construction, donc la mesure de mémoire est faite à part.
+	gc.collect()
+	tracemalloc.start()
+	manager.attendees = build_attendees_dict(json.loads(page))
+	gc.collect()
+	current, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	print(f"retained: {current / 2 ** 20:.1f} MiB ({current / count:.0f} B/attendee), {peak / 2 ** 20:.1f} MiB peak")
+
+	start = time.perf_counter()
+	session = json.dumps(manager.serialize_attendees())
+	elapsed = time.perf_counter() - start
+	print(f"serialized session: {len(session) / 2 ** 20:.1f} MiB in {elapsed:.2f} s")
+
+	start = time.perf_counter()
+	manager.load_serialized_attendees(json.loads(session))
+	elapsed = time.perf_counter() - start
+	print(f"session reloaded in {elapsed:.2f} s")
+	return current, len(session)
+
+def main():
+	parser = argparse.ArgumentParser(description="Mémoire retenue par la liste de participants")
+	parser.add_argument("--count", type=int, default=50000)
+	args = parser.parse_args()
+	logging.disable(logging.INFO)
+	run(args.count)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,50 @@
+import sys
+import time
+import tempfile
+import argparse
+import logging
+
+from eventbrite_manager import Attendee
+from nametag_generator import NametagGenerator
+from benchmarks.synthetic import make_attendee_objects
+
+
+def setup_generator(template, engine="auto"):
+	gen = NametagGenerator()
+	gen.engine = engine
+	gen.load_template(template)
+	gen.add_context_entry("event", False, "Bootcamp 2025")
+	gen.add_context_entry("name1", True, "first_name")
+	gen.add_context_entry("name2", True, "last_name")
+	gen.add_context_entry("role", True, "position")
+	gen.add_context_entry("company", True, "company")
+	return gen
+
+def run(template, count, steps):
+	attendees = [Attendee.build_from_object(obj) for obj in make_attendee_objects(count)]
+	results = {}
+	with tempfile.TemporaryDirectory() as tmpdir:
+		for engine in ["docxtpl", "compiled", "fast"]:
+			gen = setup_generator(template, engine)
+			if engine == "fast" and not gen.use_fast_path:
+				print(f"{engine:>10}: skipped, template is not a simple substitution template")
+				continue
+			start = time.perf_counter()
+			for att in attendees:
+				gen.generate_nametag(att, f"{tmpdir}/{att.attendee_id}_nametag.docx", steps)
+			elapsed = time.perf_counter() - start
+			results[engine] = count / elapsed
+			print(f"{engine:>10}: {count} badges in {elapsed:.2f} s ({results[engine]:.1f} badges/s)")
+	return results
+
+def main():
+	parser = argparse.ArgumentParser(description="Débit de génération des cocardes")
+	parser.add_argument("--template", default="templates/Bootcamp2025_QR.docx")
+	parser.add_argument("--count", type=int, default=100)
+	parser.add_argument("--steps", nargs="*", default=["add_qr_code"])
+	args = parser.parse_args()
+	logging.disable(logging.INFO)
+	run(args.template, args.count, args.steps)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,97 @@
+import os
+import sys
+import time
+import argparse
+import logging
+import tempfile
+import threading
+
+from eventbrite_manager import EventbriteManager
+from watch import WatchPipeline, MAX_ATTEMPTS
+from benchmarks.fake_eventbrite import FakeEventbriteServer
+from benchmarks.bench_render import setup_generator
+from benchmarks.synthetic import make_attendee_object
+
+
+def wait_for(condition, timeout):
+	deadline = time.monotonic() + timeout
+	while time.monotonic() < deadline:
+		if condition():
+			return True
+		time.sleep(0.05)
+	return False
+
+def run(template, count, timeout):
+	# Mode --watch sans interface contre le faux serveur : une inscription ajoutée après le démarrage doit arriver au spool.
+	with FakeEventbriteServer(count) as server, tempfile.TemporaryDirectory() as tmpdir:
+		eventbrite = EventbriteManager()
+		eventbrite.connect("fake", server.url)
+		eventbrite.load_events(list(server.events))
+		spool_dir = os.path.join(tmpdir, "spool")
+		pipeline = WatchPipeline(eventbrite, setup_generator(template), spool_dir, max_workers=1)
+		thread = threading.Thread(target=pipeline.run, args=(lambda: None, 0.2), daemon=True)
+		thread.start()
+		try:
+			if not wait_for(lambda: pipeline.spooled_count() >= count, timeout):
+				print(f"only {pipeline.spooled_count()}/{count} initial nametags spooled")
+				return False
+			event_id = next(iter(server.events))
+			new_attendee = make_attendee_object(count, event_id)
+			new_attendee["changed"] = "2099-01-01T00:00:00Z"
+			server.attendees[event_id].append(new_attendee)
+			pipeline.wakeup.set()
+			filename = pipeline.filename(new_attendee["id"])
+			if not wait_for(lambda: os.path.exists(os.path.join(spool_dir, filename)), timeout):
+				print(f"new registration {new_attendee['id']} was not spooled")
+				return False
+		finally:
+			pipeline.stop()
+			thread.join(timeout)
+	print(f"watch mode spooled {count} initial nametags and the new registration")
+	return True
+
+def run_failing(template, count, timeout):
+	# Un rendu qui lève une exception ne doit pas arrêter la boucle, et chaque cocarde n'est retentée que MAX_ATTEMPTS fois.
+	with FakeEventbriteServer(count) as server, tempfile.TemporaryDirectory() as tmpdir:
+		eventbrite = EventbriteManager()
+		eventbrite.connect("fake", server.url)
+		eventbrite.load_events(list(server.events))
+		nametag_gen = setup_generator(template)
+		calls = []
+		def generate_nametags(jobs, *args, **kwargs):
+			calls.append(len(jobs))
+			raise OSError("disk full")
+		nametag_gen.generate_nametags = generate_nametags
+		pipeline = WatchPipeline(eventbrite, nametag_gen, os.path.join(tmpdir, "spool"), max_workers=1)
+		thread = threading.Thread(target=pipeline.run, args=(lambda: None, 0.2), daemon=True)
+		thread.start()
+		try:
+			if not wait_for(lambda: len(pipeline.failures) >= count and min(pipeline.failures.values()) >= MAX_ATTEMPTS, timeout):
+				print(f"failing nametags were not retried {MAX_ATTEMPTS} times: {dict(pipeline.failures)}")
+				return False
+			time.sleep(0.5)
+			if not thread.is_alive():
+				print("watch loop stopped after a render error")
+				return False
+			if sum(calls) != count * MAX_ATTEMPTS:
+				print(f"{sum(calls)} nametag renders attempted, expected {count * MAX_ATTEMPTS}")
+				return False
+		finally:
+			pipeline.stop()
+			thread.join(timeout)
+	print(f"watch mode survived render errors and gave up after {MAX_ATTEMPTS} attempts")
+	return True
+
+def main():
+	parser = argparse.ArgumentParser(description="Vérification du mode --watch contre le faux serveur Eventbrite")
+	parser.add_argument("--template", default="templates/Bootcamp2025_QR.docx")
+	parser.add_argument("--count", type=int, default=5)
+	parser.add_argument("--timeout", type=float, default=30)
+	args = parser.parse_args()
+	logging.disable(logging.INFO)
+	ok = run(args.template, args.count, args.timeout)
+	ok = run_failing(args.template, args.count, args.timeout) and ok
+	sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,143 @@
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from benchmarks.synthetic import make_attendee_objects
+
+
+class FakeEventbriteHandler(BaseHTTPRequestHandler):
+	# HTTP/1.1 pour garder les connexions ouvertes entre les requêtes, comme le vrai serveur.
+	protocol_version = "HTTP/1.1"
+
+	def log_message(self, format, *args):
+		pass
+
+	def send_json(self, status, body, headers=None):
+		data = json.dumps(body).encode("utf-8")
+		self.send_response(status)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(data)))
+		for name, value in (headers or {}).items():
+			self.send_header(name, value)
+		self.end_headers()
+		self.wfile.write(data)
+
+	def do_GET(self):
+		server = self.server
+		url = urlparse(self.path)
+		query = {k: v[0] for k, v in parse_qs(url.query).items()}
+		parts = [part for part in url.path.split("/") if part and part != "v3"]
+		retry_after = server.take_request_slot()
+		if retry_after is not None:
+			# Même forme de réponse qu'Eventbrite quand on dépasse le quota.
+			return self.send_json(429, {
+				"status_code": 429,
+				"error": "HIT_RATE_LIMIT",
+				"error_description": "Hourly rate limit has been reached for this token.",
+			}, {"Retry-After": str(retry_after)})
+		if server.latency:
+			time.sleep(server.latency)
+
+		if parts == ["users", "me"]:
+			return self.send_json(200, {"id": "1", "name": "Banc d'essai", "emails": [{"email": "bench@example.com"}]})
+		if parts == ["users", "me", "organizations"]:
+			return self.send_json(200, {"organizations": [{"id": server.org_id, "name": "SMPTE Montréal"}]})
+		if len(parts) == 3 and parts[0] == "organizations" and parts[2] == "events":
+			return self.send_json(200, {"events": [event for event in server.events.values()]})
+		if len(parts) >= 2 and parts[0] == "events" and parts[1] in server.events:
+			if len(parts) == 2:
+				return self.send_json(200, server.events[parts[1]])
+			if parts[2:] == ["attendees"]:
+				return self.send_json(200, server.attendees_page(parts[1], query))
+		self.send_json(404, {"status_code": 404, "error": "NOT_FOUND", "error_description": f"Unknown path {url.path}"})
+
+
+class FakeEventbriteServer(ThreadingHTTPServer):
+	# Remplaçant local des points d'accès d'Eventbrite utilisés par EventbriteManager.
+	# latency : délai par requête (s). rate_limit : nombre de requêtes permises par fenêtre de rate_window secondes.
+	daemon_threads = True
+
+	def __init__(self, attendee_count=1000, event_id="1000", page_size=50, latency=0.0, rate_limit=None, rate_window=1.0, seed=0):
+		super().__init__(("127.0.0.1", 0), FakeEventbriteHandler)
+		self.org_id = "7"
+		self.page_size = page_size
+		self.latency = latency
+		self.rate_limit = rate_limit
+		self.rate_window = rate_window
+		self.lock = threading.Lock()
+		self.window_start = time.monotonic()
+		self.window_count = 0
+		self.request_count = 0
+		self.rejected_count = 0
+		self.events = {}
+		self.attendees = {}
+		self.add_event(event_id, attendee_count, seed)
+		self.thread = None
+
+	@property
+	def url(self):
+		return f"http://127.0.0.1:{self.server_address[1]}/v3"
+
+	def add_event(self, event_id, attendee_count, seed=0):
+		self.events[event_id] = {
+			"id": event_id,
+			"organization_id": self.org_id,
+			"name": {"text": f"Événement synthétique {event_id}"},
+			"start": {"local": "2025-06-01T09:00:00", "timezone": "America/Montreal"},
+		}
+		first_index = sum(len(attendees) for attendees in self.attendees.values())
+		self.attendees[event_id] = make_attendee_objects(attendee_count, event_id, seed, first_index)
+
+	def take_request_slot(self):
+		# Retourne None si la requête est acceptée, sinon le nombre de secondes à attendre.
+		with self.lock:
+			self.request_count += 1
+			if self.rate_limit is None:
+				return None
+			now = time.monotonic()
+			if now - self.window_start >= self.rate_window:
+				self.window_start = now
+				self.window_count = 0
+			if self.window_count >= self.rate_limit:
+				self.rejected_count += 1
+				return max(1, round(self.rate_window - (now - self.window_start)))
+			self.window_count += 1
+			return None
+
+	def attendees_page(self, event_id, query):
+		attendees = self.attendees[event_id]
+		changed_since = query.get("changed_since")
+		if changed_since:
+			attendees = [att for att in attendees if att["changed"] >= changed_since]
+		# Comme Eventbrite : page numérotée, ou jeton de continuation (ici, simplement le numéro de la page suivante).
+		page = int(query.get("continuation") or query.get("page") or 1)
+		page_count = max(1, -(-len(attendees) // self.page_size))
+		has_more_items = page < page_count
+		return {
+			"pagination": {
+				"object_count": len(attendees),
+				"page_number": page,
+				"page_size": self.page_size,
+				"page_count": page_count,
+				"continuation": str(page + 1) if has_more_items else None,
+				"has_more_items": has_more_items,
+			},
+			"attendees": attendees[(page - 1) * self.page_size:page * self.page_size],
+		}
+
+	def start(self):
+		self.thread = threading.Thread(target=self.serve_forever, name="fake-eventbrite", daemon=True)
+		self.thread.start()
+		return self
+
+	def stop(self):
+		self.shutdown()
+		self.server_close()
+
+	def __enter__(self):
+		return self.start()
+
+	def __exit__(self, *exc):
+		self.stop()
@@ -0,0 +1,205 @@
+import os
+import sys
+import copy
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+
+from eventbrite_manager import EventbriteManager, PrintStatus, build_attendees_dict
+from session_store import SessionStore
+from benchmarks.fake_eventbrite import FakeEventbriteServer
+from benchmarks.bench_render import setup_generator
+
+
+class StageTimer:
+	# Chaque étape donne une ligne de résultats : taille, étape, durée, débit, et mesures propres à l'étape.
+	def __init__(self):
+		self.results = []
+
+	def run(self, size, stage, func, count=None, **extra):
+		start = time.perf_counter()
+		try:
+			value = func()
+		except Exception as e:
+			self.results.append({"size": size, "stage": stage, "error": f"{type(e).__name__}: {e}"})
+			print(f"{size:>8} {stage:<20} FAILED: {e}")
+			return None
+		elapsed = time.perf_counter() - start
+		record = {"size": size, "stage": stage, "seconds": round(elapsed, 4)}
+		if count:
+			record["count"] = count
+			record["per_second"] = round(count / elapsed, 1) if elapsed > 0 else None
+		record.update(extra)
+		self.results.append(record)
+		rate = f" ({record['per_second']}/s)" if count else ""
+		print(f"{size:>8} {stage:<20} {elapsed:8.3f} s{rate}")
+		return value
+
+def make_table():
+	# Le tableau est optionnel : sans PySide6 (serveur de calcul), l'étape est sautée.
+	try:
+		os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+		from PySide6.QtWidgets import QApplication, QTableView
+		from attendee_model import AttendeeTableModel
+	except ImportError:
+		return None
+	app = QApplication.instance() or QApplication([])
+	def fill(eventbrite):
+		model = AttendeeTableModel(eventbrite)
+		view = QTableView()
+		view.setModel(model)
+		view.setSortingEnabled(True)
+		view.sortByColumn(0, view.horizontalHeader().sortIndicatorOrder())
+		# Même chose que MainWindow.fill_attendees_table, puis un filtre comme dans la barre de recherche.
+		model.refresh()
+		app.processEvents()
+		model.set_filter_text("tremblay")
+		app.processEvents()
+		return view
+	return fill
+
+def run_size(timer, args, size, fill_table, tmpdir):
+	server = FakeEventbriteServer(size, page_size=args.page_size, latency=args.latency, rate_limit=args.rate_limit, seed=args.seed)
+	eventbrite = EventbriteManager()
+	with server:
+		eventbrite.connect("benchmark-token", server.url)
+		if eventbrite.user is None or not eventbrite.user.ok:
+			raise RuntimeError(f"Could not connect to the fake Eventbrite server at {server.url}")
+		eventbrite.load_event("1000")
+		new_attendees = timer.run(size, "download", lambda: eventbrite.download_attendees(args.workers), size)
+		timer.results[-1].update(requests=server.request_count, rate_limited=server.rejected_count, retries=eventbrite.quota()["retries"])
+	if new_attendees is None:
+		return
+
+	timer.run(size, "merge", lambda: eventbrite.update_attendees(new_attendees), size)
+	# Le pire cas de la fusion : tous les profils ont changé chez Eventbrite et sont fusionnés champ par champ.
+	changed_objects = copy.deepcopy(server.attendees["1000"])
+	for obj in changed_objects:
+		obj["profile"]["company"] += " inc."
+	changed_attendees = build_attendees_dict(changed_objects, "1000")
+	timer.run(size, "merge_overwrite", lambda: eventbrite.update_attendees(changed_attendees, True), size)
+
+	if fill_table is not None:
+		timer.run(size, "fill_table", lambda: fill_table(eventbrite), size)
+
+	# Recherche de l'accueil : construction de l'index, puis des requêtes pendant la frappe et des codes-barres.
+	attendees = list(eventbrite.attendees.values())
+	# fill_table a déjà construit l'index en filtrant la table : on le reconstruit au complet.
+	timer.run(size, "lookup_build", lambda: eventbrite.lookup.rebuild(eventbrite.attendees.values()), size)
+	queries = [att.last_name[:n] for att in attendees[:50] for n in (3, 5)] + [att.barcode for att in attendees[:100]]
+	timer.run(size, "lookup_search", lambda: [eventbrite.search_attendees(q) for q in queries], len(queries))
+
+	companies = {company: company.upper() for company in eventbrite.get_value_counts("company")}
+	timer.run(size, "manual_replacement", lambda: eventbrite.apply_replacements("company", companies), size)
+
+	store = SessionStore(os.path.join(tmpdir, f"session_{size}.db"))
+	def save():
+		dirty_ids, dirty_payload_ids = eventbrite.take_dirty()
+		return store.save(eventbrite.session_meta(), eventbrite.event["id"], eventbrite.attendees, dirty_ids, dirty_payload_ids)
+	eventbrite.mark_all_dirty(include_payloads=True)
+	timer.run(size, "session_save_full", save, size)
+	# Comme une autosauvegarde pendant l'impression : 1 % des participants changent de statut.
+	changed_ids = random.Random(args.seed).sample(list(eventbrite.attendees), max(1, size // 100))
+	for att_id in changed_ids:
+		eventbrite.set_printing_status(att_id, PrintStatus.PRINTED)
+	timer.run(size, "session_save_delta", save, len(changed_ids))
+	timer.run(size, "session_load", store.load, size)
+	store.close()
+
+	if args.badges > 0:
+		generator = setup_generator(args.template)
+		attendees = list(eventbrite.attendees.values())[:args.badges]
+		def generate():
+			for att in attendees:
+				generator.generate_nametag(att, os.path.join(tmpdir, f"{att.attendee_id}_nametag.docx"), args.steps)
+		timer.run(size, "generate_nametag", generate, len(attendees))
+		# Regénération après une correction : seule la cocarde modifiée est refaite, le manifeste saute les autres.
+		regenerate_dir = os.path.join(tmpdir, f"regenerate_{size}")
+		os.makedirs(regenerate_dir)
+		def regenerate():
+			jobs = [
+				(att.attendee_id, eventbrite.badge_data([att]), os.path.join(regenerate_dir, f"{att.attendee_id}_nametag.docx"))
+				for att in attendees
+			]
+			return generator.generate_nametags(jobs, args.steps, 1)
+		regenerate()
+		eventbrite.set_attendee_value(attendees[0].attendee_id, "company", "Compagnie corrigée")
+		timer.run(size, "regenerate_unchanged", regenerate, len(attendees))
+
+def git_revision():
+	try:
+		return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+def compare(results, baseline_path, tolerance, min_delta=0.01):
+	# Retourne les étapes plus lentes que la référence de plus de tolerance (0.25 = 25 %).
+	# Les écarts de moins de min_delta secondes sont du bruit de mesure sur les petites étapes.
+	with open(baseline_path, encoding="utf-8") as file:
+		baseline = {(r["size"], r["stage"]): r for r in json.load(file)["results"] if "seconds" in r}
+	regressions = []
+	for r in results:
+		ref = baseline.get((r["size"], r["stage"]))
+		if ref is None:
+			continue
+		if "seconds" not in r:
+			regressions.append(f"{r['stage']} ({r['size']}): failed, {r['error']}")
+		elif r["seconds"] > ref["seconds"] * (1 + tolerance) and r["seconds"] - ref["seconds"] > min_delta:
+			regressions.append(f"{r['stage']} ({r['size']}): {ref['seconds']:.3f} s -> {r['seconds']:.3f} s")
+	return regressions
+
+def main():
+	parser = argparse.ArgumentParser(description="Banc d'essai complet contre un faux serveur Eventbrite")
+	parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="nombres de participants à tester")
+	parser.add_argument("--page-size", type=int, default=50, help="participants par page (50 chez Eventbrite)")
+	parser.add_argument("--latency", type=float, default=0.0, help="délai par requête du faux serveur, en secondes")
+	parser.add_argument("--rate-limit", type=int, help="requêtes permises par seconde avant les réponses 429")
+	parser.add_argument("--workers", type=int, default=8, help="téléchargements de pages en parallèle")
+	parser.add_argument("--badges", type=int, default=50, help="cocardes générées par taille (0 pour sauter l'étape)")
+	parser.add_argument("--template", default="templates/Bootcamp2025_QR.docx")
+	parser.add_argument("--steps", nargs="*", default=["add_qr_code"])
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--output", default="benchmarks/results.json", help="fichier JSON des résultats")
+	parser.add_argument("--baseline", help="résultats de référence, le code de sortie est 1 en cas de régression")
+	parser.add_argument("--tolerance", type=float, default=0.25, help="ralentissement toléré par rapport à la référence")
+	parser.add_argument("--min-delta", type=float, default=0.01, help="écart minimal en secondes pour compter une régression")
+	args = parser.parse_args()
+	logging.disable(logging.WARNING)
+
+	timer = StageTimer()
+	fill_table = make_table()
+	if fill_table is None:
+		print("PySide6 is not available, skipping the fill_table stage")
+	with tempfile.TemporaryDirectory() as tmpdir:
+		for size in args.sizes:
+			run_size(timer, args, size, fill_table, tmpdir)
+
+	report = {
+		"meta": {
+			"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+			"revision": git_revision(),
+			"python": platform.python_version(),
+			"platform": platform.platform(),
+			"cpu_count": os.cpu_count(),
+			"args": vars(args),
+		},
+		"results": timer.results,
+	}
+	with open(args.output, "w", encoding="utf-8") as file:
+		json.dump(report, file, indent=2, ensure_ascii=False)
+	print(f"Results written to {args.output}")
+
+	if args.baseline is not None:
+		regressions = compare(timer.results, args.baseline, args.tolerance, args.min_delta)
+		for line in regressions:
+			print(f"REGRESSION {line}")
+		sys.exit(1 if regressions else 0)
+	sys.exit(1 if any("error" in r for r in timer.results) else 0)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,57 @@
+import random
+
+
+FIRST_NAMES = ["Émilie", "Jean", "Marie-Ève", "François", "Chloé", "Olivier", "Zoë", "Mathieu", "Noémie", "Raphaël", "Sarah", "Li", "Priya", "Kevin"]
+LAST_NAMES = ["Tremblay", "Gagnon", "Roy", "Côté", "Bouchard", "Gauthier", "Morin", "Lavoie", "Fortin", "Gélinas", "O'Brien", "Nguyen", "Smith & Fils"]
+COMPANIES = ["Radio-Canada", "Ubisoft", "Moment Factory", "CBC/Radio-Canada", "Grass Valley", "Ross Video", "Bell Média", "Québecor", "Indépendant", ""]
+POSITIONS = ["Ingénieur", "Technicienne", "Directeur technique", "Étudiant", "Monteuse", "Chef opérateur", ""]
+
+
+def make_attendee_object(index, event_id="1000", rng=random):
+	# Un participant tel que retourné par /events/{id}/attendees/, avec les gros blocs qu'on n'utilise pas.
+	first_name = rng.choice(FIRST_NAMES)
+	last_name = rng.choice(LAST_NAMES)
+	email = f"{first_name}.{last_name}.{index}@example.com".lower().replace(" ", "")
+	second = rng.randrange(60)
+	return {
+		"id": str(2000000000 + index),
+		"event_id": event_id,
+		"order_id": str(5000000000 + index // 2),
+		"ticket_class_id": "123456789",
+		"ticket_class_name": rng.choice(["Général", "Étudiant", "Conférencier"]),
+		"created": f"2025-01-{index % 28 + 1:02d}T12:00:{second:02d}Z",
+		"changed": f"2025-02-{index % 28 + 1:02d}T12:00:{second:02d}Z",
+		"status": "Attending",
+		"cancelled": False,
+		"refunded": False,
+		"checked_in": False,
+		"costs": {
+			"base_price": {"currency": "CAD", "value": 15000, "major_value": "150.00", "display": "CA$150.00"},
+			"eventbrite_fee": {"currency": "CAD", "value": 899, "major_value": "8.99", "display": "CA$8.99"},
+			"gross": {"currency": "CAD", "value": 17249, "major_value": "172.49", "display": "CA$172.49"},
+		},
+		"profile": {
+			"first_name": first_name,
+			"last_name": last_name,
+			"name": f"{first_name} {last_name}",
+			"email": email,
+			"job_title": rng.choice(POSITIONS),
+			"company": rng.choice(COMPANIES),
+			"addresses": {
+				"work": {"address_1": f"{index} rue Sainte-Catherine", "city": "Montréal", "region": "QC", "postal_code": "H2X 1Y1", "country": "CA"},
+			},
+		},
+		"answers": [
+			{"question_id": "1", "question": "Restrictions alimentaires", "type": "text", "answer": rng.choice(["Aucune", "Végétarien", "Sans gluten"])},
+			{"question_id": "2", "question": "Membre SMPTE?", "type": "multiple_choice", "answer": rng.choice(["Oui", "Non"])},
+		],
+		"barcodes": [
+			{"barcode": f"{index:06d}{rng.randrange(10 ** 12):012d}", "status": "unused", "created": "2025-01-01T12:00:00Z", "changed": "2025-01-01T12:00:00Z"},
+		],
+		"resource_uri": f"https://www.eventbriteapi.com/v3/events/{event_id}/attendees/{2000000000 + index}/",
+	}
+
+def make_attendee_objects(count, event_id="1000", seed=0, first_index=0):
+	# Comme chez Eventbrite, les ID de participants sont uniques d'un événement à l'autre : first_index décale ceux du suivant.
+	rng = random.Random(seed)
+	return [make_attendee_object(first_index + i, event_id, rng) for i in range(count)]
@@ -0,0 +1,166 @@
+import time
+import random
+import logging
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from instrumentation import metrics
+
+
+EVENTBRITE_API_URL = "https://www.eventbriteapi.com/v3"
+# Quota documenté par Eventbrite, par jeton.
+HOURLY_LIMIT = 2000
+QUOTA_WINDOW = 3600
+# Réponses temporaires qui valent la peine d'être réessayées.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class EventbriteApiError(Exception):
+	# Le serveur n'a pas pu être joint, ou le quota ne permet plus de requête avant longtemps.
+	pass
+
+
+class ApiResponse(dict):
+	# Même interface que les objets du SDK d'Eventbrite : le JSON de la réponse, plus ok, status_code et headers.
+	def __init__(self, data, status_code, headers):
+		super().__init__(data)
+		self.status_code = status_code
+		self.headers = headers
+
+	@property
+	def ok(self):
+		return 200 <= self.status_code < 400
+
+
+class EventbriteClient:
+	# Une seule session HTTP gardée ouverte (keep-alive), partagée par les fils de téléchargement des pages.
+	# Les réponses 429 et les erreurs temporaires sont réessayées avec un délai exponentiel, ou celui de Retry-After.
+	def __init__(self, api_token, api_url=EVENTBRITE_API_URL, pool_size=16, max_retries=5, backoff=0.5, max_backoff=30, max_wait=120, hourly_limit=HOURLY_LIMIT, timeout=30):
+		self.oauth_token = api_token
+		self.api_url = api_url.rstrip("/")
+		self.max_retries = max_retries
+		self.backoff = backoff
+		self.max_backoff = max_backoff
+		# Un Retry-After plus long que max_wait (quota horaire épuisé) n'est pas attendu, la requête échoue.
+		self.max_wait = max_wait
+		self.hourly_limit = hourly_limit
+		self.timeout = timeout
+		self.session = requests.Session()
+		self.session.headers["Authorization"] = f"Bearer {api_token}"
+		adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+		self.session.mount("https://", adapter)
+		self.session.mount("http://", adapter)
+		# Moments des requêtes de la dernière heure, pour suivre le quota de notre côté.
+		self.lock = threading.Lock()
+		self.request_times = deque()
+		self.request_count = 0
+		self.retry_count = 0
+		self.rate_limited_count = 0
+		self.quota_warned = False
+
+	def close(self):
+		self.session.close()
+
+	def get(self, path, params=None):
+		url = self.api_url + "/" + path.lstrip("/")
+		for attempt in range(self.max_retries + 1):
+			self.take_budget()
+			try:
+				response = self.session.get(url, params=params, timeout=self.timeout)
+			except (requests.ConnectionError, requests.Timeout) as e:
+				if attempt == self.max_retries:
+					raise EventbriteApiError(f"Could not reach Eventbrite at {url}: {e}") from e
+				self.wait_before_retry(attempt, None, f"{type(e).__name__}")
+				continue
+			if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+				if response.status_code == 429:
+					with self.lock:
+						self.rate_limited_count += 1
+				delay = self.retry_after(response)
+				if delay is not None and delay > self.max_wait:
+					logging.error(f"Eventbrite asks to wait {delay:.0f} s before the next request, giving up on {path}")
+					return self.make_response(response)
+				self.wait_before_retry(attempt, delay, f"HTTP {response.status_code}")
+				continue
+			return self.make_response(response)
+
+	def get_user(self):
+		return self.get("/users/me/")
+
+	def get_event(self, event_id):
+		return self.get(f"/events/{event_id}/")
+
+	@staticmethod
+	def make_response(response):
+		try:
+			data = response.json()
+		except ValueError:
+			# Une page d'erreur HTML d'un proxy, par exemple : même forme que les erreurs d'Eventbrite.
+			data = {"status_code": response.status_code, "error": "INVALID_RESPONSE", "error_description": response.text[:200]}
+		if not isinstance(data, dict):
+			data = {"data": data}
+		return ApiResponse(data, response.status_code, response.headers)
+
+	@staticmethod
+	def retry_after(response):
+		# En secondes ou en date HTTP.
+		value = response.headers.get("Retry-After")
+		if value is None:
+			return None
+		try:
+			return max(0.0, float(value))
+		except ValueError:
+			pass
+		try:
+			return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+		except (TypeError, ValueError):
+			return None
+
+	def wait_before_retry(self, attempt, delay, reason):
+		if delay is None:
+			# Délai exponentiel avec une part de hasard, pour que les fils parallèles ne réessaient pas tous en même temps.
+			delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+		with self.lock:
+			self.retry_count += 1
+		logging.warning(f"{reason} from Eventbrite, retrying in {delay:.1f} s (attempt {attempt + 2}/{self.max_retries + 1})")
+		metrics.record("api.retry_wait", delay)
+		time.sleep(delay)
+
+	def take_budget(self):
+		# Compte la requête dans la fenêtre d'une heure. Si le quota est atteint, attend qu'une place se libère,
+		# ou échoue tout de suite si ce serait trop long.
+		while True:
+			with self.lock:
+				now = time.monotonic()
+				while self.request_times and now - self.request_times[0] >= QUOTA_WINDOW:
+					self.request_times.popleft()
+				if len(self.request_times) < self.hourly_limit:
+					self.request_times.append(now)
+					self.request_count += 1
+					used = len(self.request_times)
+					break
+				wait = self.request_times[0] + QUOTA_WINDOW - now
+			if wait > self.max_wait:
+				raise EventbriteApiError(f"Hourly quota of {self.hourly_limit} requests reached, next request possible in {wait / 60:.0f} min")
+			logging.warning(f"Hourly quota reached, waiting {wait:.1f} s")
+			time.sleep(wait)
+		if used >= self.hourly_limit * 0.8 and not self.quota_warned:
+			self.quota_warned = True
+			logging.warning(f"{used} of {self.hourly_limit} hourly Eventbrite requests used")
+
+	def quota(self):
+		with self.lock:
+			now = time.monotonic()
+			used = sum(1 for t in self.request_times if now - t < QUOTA_WINDOW)
+			return {
+				"used_last_hour": used,
+				"hourly_limit": self.hourly_limit,
+				"remaining": max(0, self.hourly_limit - used),
+				"requests": self.request_count,
+				"retries": self.retry_count,
+				"rate_limited": self.rate_limited_count,
+			}
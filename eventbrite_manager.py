@@ -1,8 +1,17 @@
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
 from enum import IntEnum
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import Counter
+import sys
+import json
+import threading
+import zlib
+import base64
 import logging
 
-from eventbrite import Eventbrite
+from instrumentation import metrics
+from attendee_lookup import AttendeeLookup, SEARCH_FIELDS
+from response_cache import ResponseCache
 
 
 class PrintStatus(IntEnum):
@@ -11,7 +20,8 @@ class PrintStatus(IntEnum):
 	EXCLUDED = 2
 
 
-@dataclass
+# slots=True : pas de __dict__ par participant, ce qui compte avec des dizaines de milliers de rangées.
+@dataclass(slots=True)
 class Attendee:
 	attendee_id: str
 	first_name: str
@@ -21,7 +31,22 @@ class Attendee:
 	company: str
 	barcode: str
 	printing_status: IntEnum
-	raw_data: any
+	# Horodatage 'changed' d'Eventbrite, gardé à part pour la synchro incrémentale.
+	changed: str = ""
+	# Événement de l'inscription. Vide pour les sessions d'avant le mode multi-événements, voir load_session_data.
+	event_id: str = ""
+	# Le JSON complet d'Eventbrite, compressé avec zlib. On ne s'en sert presque jamais, voir raw_data.
+	raw_payload: bytes = b""
+
+	@property
+	def raw_data(self):
+		if not self.raw_payload:
+			return {}
+		return json.loads(zlib.decompress(self.raw_payload))
+
+	@classmethod
+	def field_names(cls):
+		return [name for name in cls.__dataclass_fields__ if name != "raw_payload"]
 
 	def __getitem__(self, index):
 		if index not in self.__dataclass_fields__:
@@ -34,35 +59,94 @@ class Attendee:
 		setattr(self, index, val)
 
 	@classmethod
-	def build_from_object(cls, attendee_object):
+	def build_from_object(cls, attendee_object, event_id=""):
 		obj = attendee_object
 		return cls(
 			obj["id"].strip(),
 			obj["profile"]["first_name"].strip(),
 			obj["profile"]["last_name"].strip(),
 			obj["profile"]["email"].strip(),
-			obj["profile"].get("job_title", "").strip(),
-			obj["profile"].get("company", "").strip(),
+			# Les rôles et compagnies se répètent beaucoup d'un participant à l'autre.
+			sys.intern(obj["profile"].get("job_title", "").strip()),
+			sys.intern(obj["profile"].get("company", "").strip()),
 			obj["barcodes"][0]["barcode"].strip(),
 			PrintStatus.UNPRINTED,
-			attendee_object
+			obj.get("changed", ""),
+			obj.get("event_id") or event_id,
+			zlib.compress(json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
 		)
 
+	def serialize(self, include_payload=True):
+		data = {name: getattr(self, name) for name in self.field_names()}
+		if include_payload:
+			data["raw_payload"] = base64.b64encode(self.raw_payload).decode("ascii")
+		return data
+
+	@classmethod
+	def deserialize(cls, data):
+		data = dict(data)
+		if "raw_data" in data:
+			# Ancien format de session, avec le JSON d'Eventbrite en clair.
+			raw_data = data.pop("raw_data")
+			data["changed"] = raw_data.get("changed", "")
+			data["raw_payload"] = zlib.compress(json.dumps(raw_data, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+		elif not isinstance(data.get("raw_payload"), bytes):
+			data["raw_payload"] = base64.b64decode(data.get("raw_payload", ""))
+		data["position"] = sys.intern(data["position"])
+		data["company"] = sys.intern(data["company"])
+		data["printing_status"] = PrintStatus(data["printing_status"])
+		return cls(**data)
+
+
+def build_attendees_dict(raw_attendees_data, event_id=""):
+	return {att["id"]: Attendee.build_from_object(att, event_id) for att in raw_attendees_data}
+
 
 class EventbriteManager:
-	def __init__(self):
+	# Champs qui peuvent être remplacés en lot dans l'onglet des filtres.
+	INDEXED_FIELDS = ["first_name", "last_name", "position", "company"]
+	# Champs du profil qui viennent d'Eventbrite, fusionnés un à un lors d'une synchro (voir merge_attendee).
+	SYNCED_FIELDS = ["first_name", "last_name", "email", "position", "company", "barcode"]
+	# Variables ajoutées aux champs d'Attendee pour le gabarit : les événements de la personne (voir badge_data).
+	BADGE_FIELDS = ["events", "event_names", "event_ids"]
+
+	def __init__(self, cache=None):
 		self.api = None
 		self.user = None
+		# Organisations, listes d'événements et événements déjà reçus. Gardée d'une connexion à l'autre.
+		self.cache = cache if cache is not None else ResponseCache()
 		self.event = None
+		# Tous les événements chargés, dans l'ordre. self.event est le premier, les participants de tous sont dans self.attendees.
+		# Les ID de participants d'Eventbrite sont uniques d'un événement à l'autre, donc ils restent la clé.
+		self.events = {}
 		self.attendees = {}
+		# Plus grand horodatage 'changed' vu par événement, pour la synchro incrémentale.
+		self.sync_watermarks = {}
+		# Index inversé par champ : valeur -> ensemble d'IDs de participants.
+		self.value_index = {field: {} for field in self.INDEXED_FIELDS}
+		# Code-barres et recherche par nom, pour l'accueil.
+		self.lookup = AttendeeLookup()
+		# Remplacements manuels par champ (ancienne valeur -> nouvelle), réappliqués aux participants synchronisés.
+		self.replacement_rules = {field: {} for field in self.INDEXED_FIELDS}
+		# Participants modifiés depuis la dernière sauvegarde de session (champs, et JSON d'Eventbrite).
+		self.dirty_attendees = set()
+		self.dirty_payloads = set()
 
-	def connect(self, api_token):
+	def connect(self, api_token, api_url=None, reset=True):
+		# Le client (et requests) est importé à la première connexion plutôt qu'au démarrage.
+		from eventbrite_client import EventbriteClient, EventbriteApiError, EVENTBRITE_API_URL
+		# Sans reset, on garde l'événement et les participants déjà en mémoire (session restaurée hors ligne,
+		# ou reset() déjà fait dans le fil du GUI).
+		if reset:
+			self.reset()
+		elif self.api is not None:
+			self.api.close()
+		# L'URL de l'API peut être changée pour pointer vers un faux serveur local (tests, bancs d'essai).
+		self.api = EventbriteClient(api_token, api_url or EVENTBRITE_API_URL)
 		try:
-			self.__init__()
-			self.api = Eventbrite(api_token)
-			self.user = self.api.get_user()
-		except:
-			logging.error("Error while parsing request to authenticate")
+			self.user = self.call_api("api.user", self.api.get_user)
+		except EventbriteApiError as e:
+			logging.error(f"Could not authenticate: {e}")
 			self.user = None
 			return
 		if self.user.ok:
@@ -70,48 +154,473 @@ class EventbriteManager:
 		else:
 			logging.error(f"Error {self.user['status_code']}: {self.user['error_description']}")
 
-	def fetch_orgs(self):
-		response = self.api.get("/users/me/organizations/")
-		logging.info(f"Fetched organizations for user {self.user['id']}")
-		return response["organizations"]
-
-	def fetch_events(self, org_id):
-		response = self.api.get(f"/organizations/{org_id}/events/")
-		logging.info(f"Fetched events list for organization {org_id}")
-		return response["events"]
-
-	def load_event(self, event_id):
-		new_event = self.api.get_event(event_id)
-		# Réinitialiser la liste des participants si on charge un événement différent.
-		if self.event is not None and new_event["id"] != self.event["id"]:
-			self.attendees.clear()
-		self.event = new_event
-		logging.info(f"Loaded event {self.event['name']['text']} ({event_id})")
-
-	def download_attendees(self):
-		event_id = self.event["id"]
-		# Télécharger et traiter les données d'Eventbrite
-		raw_attendees_data = self.api.get(f"/events/{event_id}/attendees/")["attendees"]
-		loaded_attendees = {att["id"]: Attendee.build_from_object(att) for att in raw_attendees_data}
+	def reset(self):
+		# Oublie l'utilisateur, les événements et les participants. La cache des réponses est gardée.
+		if self.api is not None:
+			self.api.close()
+		self.__init__(self.cache)
+
+	def call_api(self, stage, func, *args):
+		# Durée et taille de chaque réponse, par type de requête. Sans Content-Length, seule la durée est comptée.
+		with metrics.stage(stage) as timing:
+			response = func(*args)
+			timing.bytes = int(getattr(response, "headers", {}).get("Content-Length") or 0)
+		return response
+
+	def quota(self):
+		# Requêtes utilisées dans la dernière heure selon notre propre décompte, None avant la connexion.
+		return self.api.quota() if self.api is not None else None
+
+	@staticmethod
+	def check_response(response, what):
+		if not response.ok:
+			logging.error(f"Error {response.status_code} while fetching {what}: {response.get('error_description')}")
+			raise RuntimeError(f"Fetching {what} failed with HTTP {response.status_code}")
+		return response
+
+	# Les réponses en cache sont par utilisateur, pour qu'une autre clé d'API ne voie pas les organisations de la précédente.
+	def fetch_orgs(self, refresh=False):
+		user_id = self.user["id"]
+		orgs = None if refresh else self.cache.get("organizations", user_id)
+		if orgs is None:
+			response = self.call_api("api.organizations", self.api.get, "/users/me/organizations/")
+			self.check_response(response, "organizations")
+			logging.info(f"Fetched organizations for user {user_id}")
+			orgs = self.cache.put("organizations", user_id, data=response["organizations"])
+		return orgs
+
+	def cached_events(self, org_id):
+		return self.cache.get("events", self.user["id"], org_id) if self.user is not None else None
+
+	def fetch_events(self, org_id, refresh=False):
+		events = None if refresh else self.cached_events(org_id)
+		if events is None:
+			response = self.call_api("api.events", self.api.get, f"/organizations/{org_id}/events/")
+			self.check_response(response, f"events of organization {org_id}")
+			logging.info(f"Fetched events list for organization {org_id}")
+			events = self.cache.put("events", self.user["id"], org_id, data=response["events"])
+		return events
+
+	def prefetch_events(self, org_ids, max_workers=4):
+		# À la connexion : les listes d'événements de toutes les organisations en parallèle, pour que changer d'organisation soit instantané.
+		org_ids = [org_id for org_id in org_ids if self.cached_events(org_id) is None]
+		if not org_ids:
+			return
+		with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(org_ids)))) as executor:
+			futures = {executor.submit(self.fetch_events, org_id): org_id for org_id in org_ids}
+			for future in as_completed(futures):
+				try:
+					future.result()
+				except Exception as e:
+					# La liste sera redemandée quand l'organisation sera choisie.
+					logging.warning(f"Could not prefetch events of organization {futures[future]}: {e}")
+		logging.info(f"Prefetched events lists of {len(org_ids)} organizations")
+
+	def fetch_event(self, event_id, refresh=False):
+		event = None if refresh else self.cache.get("event", self.user["id"], event_id)
+		if event is None:
+			response = self.check_response(self.call_api("api.event", self.api.get_event, event_id), f"event {event_id}")
+			event = self.cache.put("event", self.user["id"], event_id, data=dict(response))
+		return event
+
+	def refresh_cache(self):
+		self.cache.invalidate()
+		logging.info("Cleared cached Eventbrite responses")
+
+	def load_event(self, event_id, refresh=False):
+		self.set_event(self.fetch_event(event_id, refresh))
+
+	def set_event(self, new_event):
+		self.set_events([new_event])
+
+	def set_events(self, new_events):
+		# Les participants des événements qui ne font plus partie de l'ensemble sont retirés, les autres gardent leur état.
+		kept_ids = {event["id"] for event in new_events}
+		removed = [att_id for att_id, att in self.attendees.items() if self.event_id_of(att) not in kept_ids]
+		if removed:
+			for att_id in removed:
+				self.unindex_attendee(self.attendees.pop(att_id))
+			self.sync_watermarks = {k: v for k, v in self.sync_watermarks.items() if k in kept_ids}
+			self.dirty_attendees.difference_update(removed)
+			self.dirty_payloads.difference_update(removed)
+		self.events = {event["id"]: event for event in new_events}
+		self.event = new_events[0]
+		for event in new_events:
+			logging.info(f"Loaded event {event['name']['text']} ({event['id']})")
+
+	@property
+	def multi_event(self):
+		return len(self.events) > 1
+
+	def event_id_of(self, att):
+		return att.event_id or (self.event["id"] if self.event is not None else "")
+
+	def event_name(self, event_id):
+		event = self.events.get(event_id)
+		return event["name"]["text"] if event is not None else event_id
+
+	def load_events(self, event_ids, delta=True, overwrite_profiles=False, max_workers=4, progress=None):
+		# Mode sans interface : téléchargement puis fusion dans le même fil.
+		downloads = self.download_events(event_ids, delta, max_workers, progress)
+		self.merge_downloaded_events(downloads, overwrite_profiles)
+		return downloads
+
+	def download_events(self, event_ids, delta=True, max_workers=4, progress=None):
+		# Réseau seulement : les événements sont téléchargés en parallèle, chacun avec ses propres pages en parallèle.
+		# Retourne (événement, nouveaux participants, filigrane) par événement, dans l'ordre demandé.
+		event_ids = [str(event_id) for event_id in event_ids]
+		page_workers = max(2, 8 // max(len(event_ids), 1))
+		pages = {}
+		lock = threading.Lock()
+		def download(event_id):
+			event = self.fetch_event(event_id)
+			watermark = self.sync_watermarks.get(event["id"]) if delta else None
+			def event_progress(done, total):
+				# Progression combinée de tous les événements.
+				with lock:
+					pages[event_id] = (done, total)
+					done, total = sum(p[0] for p in pages.values()), sum(p[1] for p in pages.values())
+				if progress is not None:
+					progress(done, total)
+			new_attendees = self.download_attendees(page_workers, event_progress, watermark, event["id"])
+			return event, new_attendees, watermark
+
+		with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(event_ids)))) as executor:
+			downloads = list(executor.map(download, event_ids))
+		logging.info(f"Downloaded {sum(len(d[1]) for d in downloads)} attendees of {len(downloads)} events")
+		return downloads
+
+	def merge_downloaded_events(self, downloads, overwrite_profiles=False):
+		self.set_events([event for event, new_attendees, watermark in downloads])
+		for event, new_attendees, watermark in downloads:
+			self.merge_synced_attendees(new_attendees, overwrite_profiles, watermark, event["id"])
+
+	def fetch_attendees_page(self, event_id, page=None, continuation=None, changed_since=None):
+		params = {}
+		if changed_since is not None:
+			params["changed_since"] = changed_since
+		if page is not None:
+			params["page"] = page
+		if continuation is not None:
+			params["continuation"] = continuation
+		response = self.call_api("api.attendees_page", self.api.get, f"/events/{event_id}/attendees/", params)
+		return self.check_response(response, f"attendees of event {event_id} (page {page})")
+
+	def download_attendees(self, max_workers=8, progress=None, changed_since=None, event_id=None):
+		if event_id is None:
+			event_id = self.event["id"]
+		# La première page nous donne le nombre total de pages.
+		first_page = self.fetch_attendees_page(event_id, changed_since=changed_since)
+		pagination = first_page.get("pagination") or {}
+		page_count = pagination.get("page_count") or 1
+		pages = {1: self.build_page(first_page, event_id)}
+		if progress is not None:
+			progress(1, page_count)
+
+		if page_count > 1:
+			# Les pages restantes sont connues d'avance, donc on les télécharge en parallèle.
+			executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+			try:
+				futures = {
+					executor.submit(self.fetch_attendees_page, event_id, page, None, changed_since): page
+					for page in range(2, page_count + 1)
+				}
+				for future in as_completed(futures):
+					# Construire les participants dès que la page arrive.
+					pages[futures[future]] = self.build_page(future.result(), event_id)
+					if progress is not None:
+						progress(len(pages), page_count)
+			finally:
+				# Si la progression lève une exception (annulation), les pages pas encore commencées sont abandonnées.
+				executor.shutdown(cancel_futures=True)
+		else:
+			# Sans page_count, il faut suivre le jeton de continuation une page à la fois.
+			while pagination.get("has_more_items") and pagination.get("continuation"):
+				response = self.fetch_attendees_page(event_id, continuation=pagination["continuation"], changed_since=changed_since)
+				pagination = response.get("pagination") or {}
+				pages[len(pages) + 1] = self.build_page(response, event_id)
+				if progress is not None:
+					progress(len(pages), len(pages))
+
+		# Réassembler dans l'ordre des pages, peu importe l'ordre d'arrivée.
+		loaded_attendees = {}
+		for page in sorted(pages):
+			loaded_attendees.update(pages[page])
+		logging.info(f"Downloaded {len(loaded_attendees)} attendees in {len(pages)} pages for event {event_id}")
 		return loaded_attendees
 
+	@staticmethod
+	def build_page(response, event_id=""):
+		with metrics.stage("attendees.build"):
+			return build_attendees_dict(response["attendees"], str(event_id))
+
+	def sync_attendees(self, delta=True, overwrite_profiles=False, max_workers=8, progress=None):
+		watermark = self.sync_watermarks.get(self.event["id"]) if delta else None
+		new_attendees = self.download_attendees(max_workers, progress, changed_since=watermark)
+		self.merge_synced_attendees(new_attendees, overwrite_profiles, watermark)
+		return new_attendees
+
+	def merge_synced_attendees(self, new_attendees, overwrite_profiles=False, watermark=None, event_id=None):
+		if event_id is None:
+			event_id = self.event["id"]
+		self.update_attendees(new_attendees, overwrite_profiles)
+		# Avancer le filigrane selon l'horodatage du serveur plutôt que l'horloge locale.
+		changed = [att.changed for att in new_attendees.values() if att.changed]
+		if watermark is not None:
+			changed.append(watermark)
+		if changed:
+			self.sync_watermarks[event_id] = max(changed)
+		if watermark is not None:
+			logging.info(f"Delta sync of event {event_id} since {watermark}: {len(new_attendees)} new or changed attendees")
+
 	def update_attendees(self, new_attendees, overwrite_profiles=False):
-		# Mettre à jour la liste existante
-		for att_id, att in new_attendees.items():
-			# Écraser ou créer l'entrée dans le dict si applicable
-			if att_id not in self.attendees:
-				self.attendees[att_id] = att
-			else:
-				if overwrite_profiles:
-					# Conserver quand même le flag d'impression complétée
-					att.printing_status = self.attendees[att_id].printing_status
+		with metrics.stage("attendees.merge"):
+			updated_ids = []
+			for att_id, att in new_attendees.items():
+				old_att = self.attendees.get(att_id)
+				if old_att is None:
 					self.attendees[att_id] = att
+					self.index_attendee(att)
+				elif att.raw_payload == old_att.raw_payload:
+					# Rien n'a changé chez Eventbrite (resynchro complète).
+					continue
+				else:
+					self.merge_attendee(old_att, att, overwrite_profiles)
+				updated_ids.append(att_id)
+			self.dirty_attendees.update(updated_ids)
+			self.dirty_payloads.update(updated_ids)
+			# Les profils qui arrivent d'Eventbrite ont les valeurs d'origine, on leur réapplique les remplacements.
+			self.apply_replacement_rules(updated_ids)
+			return updated_ids
+
+	def merge_attendee(self, att, new_att, overwrite_profiles=False):
+		# Fusion champ par champ, en comparant avec le JSON reçu à la synchro précédente : un champ n'est mis à jour que
+		# s'il a changé chez Eventbrite. S'il a aussi été modifié ici (autrement que par une règle de remplacement),
+		# la modification locale est gardée, sauf avec overwrite_profiles. L'état d'impression n'est jamais touché.
+		try:
+			base = Attendee.build_from_object(att.raw_data) if att.raw_payload else None
+		except (KeyError, IndexError, TypeError, AttributeError):
+			# JSON incomplet d'une vieille session : sans point de comparaison, Eventbrite a raison.
+			base = None
+		for field in self.SYNCED_FIELDS:
+			new_value = new_att[field]
+			base_value = base[field] if base is not None else att[field]
+			if new_value == base_value:
+				continue
+			expected = self.replacement_rules.get(field, {}).get(base_value, base_value)
+			if att[field] != expected and not overwrite_profiles:
+				logging.debug(f"Keeping local {field} of attendee {att.attendee_id} over Eventbrite's change")
+				continue
+			self.set_attendee_value(att.attendee_id, field, new_value)
+		att.changed = new_att.changed
+		att.event_id = new_att.event_id or att.event_id
+		att.raw_payload = new_att.raw_payload
+		# Le code-barres n'est pas un champ de recherche, set_attendee_value ne met pas l'index à jour pour lui.
+		self.lookup.add(att)
+
+	def rebuild_value_index(self):
+		self.value_index = {field: {} for field in self.INDEXED_FIELDS}
+		# Reconstruit à la prochaine recherche seulement.
+		self.lookup.clear()
+		for att in self.attendees.values():
+			self.index_attendee(att)
+
+	def index_attendee(self, att):
+		for field in self.INDEXED_FIELDS:
+			self.value_index[field].setdefault(att[field], set()).add(att.attendee_id)
+		self.lookup.add(att)
+
+	def unindex_attendee(self, att):
+		self.lookup.remove(att.attendee_id)
+		for field in self.INDEXED_FIELDS:
+			ids = self.value_index[field].get(att[field])
+			if ids is not None:
+				ids.discard(att.attendee_id)
+				if not ids:
+					del self.value_index[field][att[field]]
+
+	# Toutes les modifications d'un champ indexé doivent passer par ici pour garder l'index à jour.
+	def set_attendee_value(self, att_id, field, value):
+		att = self.attendees[att_id]
+		self.dirty_attendees.add(att_id)
+		if field in self.value_index:
+			old_ids = self.value_index[field].get(att[field])
+			if old_ids is not None:
+				old_ids.discard(att_id)
+				if not old_ids:
+					del self.value_index[field][att[field]]
+			self.value_index[field].setdefault(value, set()).add(att_id)
+		att[field] = value
+		if field in SEARCH_FIELDS:
+			self.lookup.add(att)
+
+	def search_attendees(self, query, fuzzy=True):
+		# Par code-barres, ID ou morceaux de nom, de compagnie ou de courriel, sans tenir compte des accents.
+		if not self.lookup.ready:
+			self.lookup.rebuild(self.attendees.values())
+		return self.lookup.search(query, fuzzy)
+
+	def find_by_barcode(self, barcode):
+		if not self.lookup.ready:
+			self.lookup.rebuild(self.attendees.values())
+		att_id = self.lookup.find_barcode(barcode)
+		return self.attendees.get(att_id) if att_id is not None else None
+
+	def set_printing_status(self, att_id, status):
+		self.attendees[att_id].printing_status = PrintStatus(status)
+		self.dirty_attendees.add(att_id)
+
+	def people(self):
+		# Listes des inscriptions d'une même personne. Avec un seul événement, chaque inscription est une personne.
+		# Sinon les inscriptions de même courriel sont regroupées, mais deux inscriptions du même événement restent deux
+		# personnes (billets achetés pour des collègues avec le courriel de l'acheteur) : la n-ième inscription d'un
+		# courriel dans chaque événement va avec la n-ième des autres événements.
+		if not self.multi_event:
+			return [[att] for att in self.attendees.values()]
+		people = {}
+		seen = Counter()
+		for att in self.attendees.values():
+			email = att.email.strip().casefold()
+			if email:
+				event_key = (email, self.event_id_of(att))
+				key = (email, seen[event_key])
+				seen[event_key] += 1
+			else:
+				key = att.attendee_id
+			people.setdefault(key, []).append(att)
+		return list(people.values())
+
+	@staticmethod
+	def person_status(registrations):
+		# Une exclusion sur une inscription exclut la personne. Une nouvelle inscription non imprimée demande une
+		# nouvelle cocarde, qui portera aussi ce nouvel événement.
+		statuses = {att.printing_status for att in registrations}
+		if PrintStatus.EXCLUDED in statuses:
+			return PrintStatus.EXCLUDED
+		if PrintStatus.UNPRINTED in statuses:
+			return PrintStatus.UNPRINTED
+		return PrintStatus.PRINTED
+
+	def badge_data(self, registrations):
+		# Copie détachée des participants (pour les processus de génération), avec les événements de la personne.
+		# La première inscription donne le profil et le code-barres.
+		data = registrations[0].serialize(include_payload=False)
+		event_ids = [self.event_id_of(att) for att in registrations]
+		data["event_ids"] = event_ids
+		data["event_names"] = [self.event_name(event_id) for event_id in event_ids]
+		data["events"] = ", ".join(data["event_names"])
+		return data
+
+	def nametag_data(self, statuses=(PrintStatus.UNPRINTED,)):
+		# (ID, données) de chaque cocarde à générer : une par personne, identifiée par sa première inscription.
+		return [
+			(registrations[0].attendee_id, self.badge_data(registrations))
+			for registrations in self.people()
+			if self.person_status(registrations) in statuses
+		]
+
+	def set_people_printing_status(self, att_ids, status):
+		# L'état d'impression d'une cocarde vaut pour toutes les inscriptions de la personne. Retourne les IDs modifiés.
+		att_ids = set(att_ids)
+		if not self.multi_event:
+			changed = [att_id for att_id in att_ids if att_id in self.attendees]
+		else:
+			changed = [
+				att.attendee_id
+				for registrations in self.people()
+				if any(att.attendee_id in att_ids for att in registrations)
+				for att in registrations
+			]
+		for att_id in changed:
+			self.set_printing_status(att_id, status)
+		return changed
+
+	def mark_all_dirty(self, include_payloads=False):
+		self.mark_dirty(self.attendees.keys(), include_payloads)
+
+	def mark_dirty(self, att_ids, include_payloads=False):
+		att_ids = [att_id for att_id in att_ids if att_id in self.attendees]
+		self.dirty_attendees.update(att_ids)
+		if include_payloads:
+			self.dirty_payloads.update(att_ids)
+
+	def take_dirty(self):
+		dirty = (self.dirty_attendees, self.dirty_payloads)
+		self.dirty_attendees = set()
+		self.dirty_payloads = set()
+		return dirty
+
+	def get_value_counts(self, field):
+		return {value: len(ids) for value, ids in self.value_index[field].items()}
+
+	def apply_replacements(self, field, replacements):
+		# replacements : ancienne valeur -> nouvelle valeur. Seuls les participants ayant l'ancienne valeur sont touchés.
+		rules = self.replacement_rules[field]
+		changed_ids = set()
+		for old_value, new_value in replacements.items():
+			if old_value == new_value:
+				continue
+			# Suivre les chaînes de remplacements (A -> B puis B -> C donne A -> C) et retirer les règles devenues nulles.
+			for key, target in list(rules.items()):
+				if target == old_value:
+					rules[key] = new_value
+			rules[old_value] = new_value
+			for key, target in list(rules.items()):
+				if key == target:
+					del rules[key]
+			ids = list(self.value_index[field].get(old_value, ()))
+			for att_id in ids:
+				self.set_attendee_value(att_id, field, new_value)
+			changed_ids.update(ids)
+		logging.info(f"Replaced {len(replacements)} values of {field} on {len(changed_ids)} attendees")
+		return changed_ids
+
+	def apply_replacement_rules(self, attendee_ids=None):
+		if attendee_ids is None:
+			attendee_ids = list(self.attendees.keys())
+		changed_ids = set()
+		for field, rules in self.replacement_rules.items():
+			if not rules:
+				continue
+			for att_id in attendee_ids:
+				new_value = rules.get(self.attendees[att_id][field])
+				if new_value is not None:
+					self.set_attendee_value(att_id, field, new_value)
+					changed_ids.add(att_id)
+		return changed_ids
+
+	def load_replacement_rules(self, rules):
+		self.replacement_rules = {field: dict(rules.get(field, {})) for field in self.INDEXED_FIELDS}
+
+	# Partie de la session qui appartient à EventbriteManager, commune à l'interface et au mode en ligne de commande.
+	def session_meta(self):
+		return {
+			"event": self.event,
+			"events": list(self.events.values()),
+			"sync_watermarks": self.sync_watermarks,
+			"replacement_rules": self.replacement_rules,
+		}
+
+	def load_session_data(self, session_data):
+		self.event = session_data["event"]
+		self.events = {event["id"]: event for event in session_data.get("events") or ([self.event] if self.event is not None else [])}
+		self.load_serialized_attendees(session_data["attendees"])
+		# Participants d'une session d'avant le mode multi-événements.
+		for att in self.attendees.values():
+			if not att.event_id:
+				att.event_id = self.event_id_of(att)
+		self.sync_watermarks = session_data.get("sync_watermarks", {})
+		self.load_replacement_rules(session_data.get("replacement_rules", {}))
 
 	def serialize_attendees(self):
-		serialized_data = {k: asdict(v) for k, v in self.attendees.items()}
+		serialized_data = {k: v.serialize() for k, v in self.attendees.items()}
 		return serialized_data
 
 	def load_serialized_attendees(self, serialized_data):
-		deserialized = {k: Attendee(**v) for k, v in serialized_data.items()}
+		deserialized = {k: Attendee.deserialize(v) for k, v in serialized_data.items()}
 		self.attendees = deserialized
+		self.rebuild_value_index()
+		# Les participants chargés correspondent à ce qui est déjà sauvegardé.
+		self.dirty_attendees.clear()
+		self.dirty_payloads.clear()
 
@@ -0,0 +1,183 @@
+import csv
+import json
+import time
+import pstats
+import logging
+import cProfile
+import threading
+from contextlib import contextmanager
+
+
+# Bornes supérieures des cases de l'histogramme des durées, en secondes.
+BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf")]
+
+# Colonnes de l'export CSV et du panneau de statistiques.
+SUMMARY_FIELDS = ["stage", "count", "total", "mean", "p50", "p95", "max", "bytes"]
+
+
+class StageStats:
+	__slots__ = ("count", "total", "min", "max", "bytes", "buckets")
+
+	def __init__(self):
+		self.count = 0
+		self.total = 0.0
+		self.min = float("inf")
+		self.max = 0.0
+		self.bytes = 0
+		self.buckets = [0] * len(BUCKETS)
+
+	def add(self, seconds):
+		self.count += 1
+		self.total += seconds
+		self.min = min(self.min, seconds)
+		self.max = max(self.max, seconds)
+		self.buckets[next(i for i, bound in enumerate(BUCKETS) if seconds <= bound)] += 1
+
+	def merge(self, data):
+		self.count += data["count"]
+		self.total += data["total"]
+		self.min = min(self.min, data["min"] if data["min"] is not None else float("inf"))
+		self.max = max(self.max, data["max"])
+		self.bytes += data["bytes"]
+		self.buckets = [a + b for a, b in zip(self.buckets, data["buckets"])]
+
+	def percentile(self, q):
+		# Approximation par la borne de la case, ramenée au maximum observé pour la dernière case.
+		if self.count == 0:
+			return None
+		rank = q * self.count
+		seen = 0
+		for bound, n in zip(BUCKETS, self.buckets):
+			seen += n
+			if seen >= rank:
+				return min(bound, self.max)
+		return self.max
+
+	def to_dict(self):
+		return {
+			"count": self.count,
+			"total": self.total,
+			"min": self.min if self.count else None,
+			"max": self.max,
+			"bytes": self.bytes,
+			"buckets": list(self.buckets),
+		}
+
+
+class StageTiming:
+	# Retourné par Metrics.stage, pour ajouter les octets lus ou écrits pendant l'étape.
+	__slots__ = ("bytes",)
+
+	def __init__(self):
+		self.bytes = 0
+
+
+class Metrics:
+	# Durées par étape (appel à l'API, rendu, écriture, étapes de rendu personnalisées...), partagées par tous les fils.
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.stages = {}
+
+	@contextmanager
+	def stage(self, name):
+		timing = StageTiming()
+		start = time.perf_counter()
+		try:
+			yield timing
+		finally:
+			self.record(name, time.perf_counter() - start, timing.bytes)
+
+	def record(self, name, seconds, nbytes=0):
+		with self.lock:
+			stats = self.stages.get(name)
+			if stats is None:
+				stats = self.stages[name] = StageStats()
+			stats.add(seconds)
+			stats.bytes += nbytes
+
+	def reset(self):
+		with self.lock:
+			self.stages = {}
+
+	def snapshot(self):
+		with self.lock:
+			return {name: stats.to_dict() for name, stats in self.stages.items()}
+
+	def take_snapshot(self):
+		# Pour les processus de génération : ce qui a été mesuré depuis le dernier envoi au processus principal.
+		with self.lock:
+			stages, self.stages = self.stages, {}
+		return {name: stats.to_dict() for name, stats in stages.items()}
+
+	def merge(self, snapshot):
+		with self.lock:
+			for name, data in snapshot.items():
+				stats = self.stages.get(name)
+				if stats is None:
+					stats = self.stages[name] = StageStats()
+				stats.merge(data)
+
+	def summary(self):
+		# Une rangée par étape, de la plus coûteuse à la moins coûteuse.
+		with self.lock:
+			rows = [
+				{
+					"stage": name,
+					"count": stats.count,
+					"total": stats.total,
+					"mean": stats.total / stats.count if stats.count else None,
+					"p50": stats.percentile(0.5),
+					"p95": stats.percentile(0.95),
+					"max": stats.max,
+					"bytes": stats.bytes,
+				}
+				for name, stats in self.stages.items()
+			]
+		return sorted(rows, key=lambda row: row["total"], reverse=True)
+
+	def export_json(self, filepath):
+		with open(filepath, "w", encoding="utf-8") as file:
+			json.dump({"buckets": BUCKETS[:-1], "summary": self.summary(), "stages": self.snapshot()}, file, indent=2)
+		logging.info(f"Exported metrics to {filepath}")
+
+	def export_csv(self, filepath):
+		with open(filepath, "w", newline="", encoding="utf-8") as file:
+			writer = csv.DictWriter(file, SUMMARY_FIELDS)
+			writer.writeheader()
+			writer.writerows(self.summary())
+		logging.info(f"Exported metrics to {filepath}")
+
+	def export(self, filepath):
+		# Le format suit l'extension du fichier.
+		if filepath.lower().endswith(".csv"):
+			self.export_csv(filepath)
+		else:
+			self.export_json(filepath)
+
+	def log_summary(self, level=logging.INFO):
+		for row in self.summary():
+			logging.log(
+				level,
+				f"{row['stage']}: {row['count']} calls, {row['total']:.2f} s total, "
+				f"mean {row['mean'] * 1000:.1f} ms, p95 {row['p95'] * 1000:.1f} ms, {row['bytes']} bytes"
+			)
+
+
+# Mesures du processus courant. Les processus de génération renvoient les leurs avec chaque lot.
+metrics = Metrics()
+
+
+@contextmanager
+def profile_to(filepath):
+	# Capture cProfile d'un seul lot. Les processus de génération ne sont pas profilés, il faut générer dans le processus courant.
+	profiler = cProfile.Profile()
+	profiler.enable()
+	try:
+		yield profiler
+	finally:
+		profiler.disable()
+		profiler.dump_stats(filepath)
+		# Un résumé lisible à côté du .prof, qui s'ouvre aussi avec snakeviz ou pstats.
+		with open(filepath + ".txt", "w", encoding="utf-8") as file:
+			pstats.Stats(profiler, stream=file).sort_stats("cumulative").print_stats(50)
+		logging.info(f"Saved profile to {filepath}")
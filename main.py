@@ -1,13 +1,16 @@
+import time
+# Mesurer le démarrage à partir d'ici, avant les imports de Qt.
+START_TIME = time.perf_counter()
+
 import sys
 import os
 import json
 import logging
-import time
 
 
+from PySide6.QtCore import QTimer
 from PySide6.QtWidgets import QApplication
 
-import main_window
 from utils import *
 
 
@@ -16,9 +19,14 @@ def main():
 	setup_basic_logging("logs", logging.INFO, logging.DEBUG)
 
 	app = QApplication(sys.argv)
+	# Importé après la création de QApplication pour pouvoir mesurer séparément le chargement de la fenêtre.
+	import_start = time.perf_counter()
+	import main_window
 	win = main_window.MainWindow()
 	win.show()
-	logging.info("Window loaded")
+	logging.info(f"Window loaded (Qt {import_start - START_TIME:.2f} s, main window {time.perf_counter() - import_start:.2f} s)")
+	# Le premier tour de la boucle d'événements correspond à la fenêtre réellement affichée.
+	QTimer.singleShot(0, lambda: logging.info(f"Startup time: {time.perf_counter() - START_TIME:.2f} s"))
 	app.exec()
 
 if __name__ == "__main__":
@@ -2,26 +2,38 @@ import os
 import sys
 import json
 import time
-import shutil
 
-from PySide6 import QtUiTools
-from PySide6.QtCore import Qt, QSignalBlocker
-from PySide6.QtWidgets import QMainWindow, QTableWidgetItem, QComboBox, QFileDialog
+from PySide6.QtCore import Qt, QSignalBlocker, QTimer
+from PySide6.QtWidgets import QMainWindow, QTableWidgetItem, QComboBox, QFileDialog, QProgressBar, QPushButton, QInputDialog
 
 from utils import *
+from qt_utils import *
 from eventbrite_manager import *
 from nametag_generator import *
+from task_runner import TaskRunner
+from attendee_model import AttendeeTableModel, PrintStatusDelegate
+from session_store import SessionStore, DEFAULT_SESSION_PATH
+from ui_loader import load_ui_class
+from instrumentation import metrics, profile_to
+from watch import WatchPipeline, SPOOL_CHECK_INTERVAL
+from response_cache import ResponseCache
 
 
-# Importation des types venant du .ui
-uiclass, baseclass = QtUiTools.loadUiType("MainWindow.ui")
+# Importation de la classe venant du .ui, précompilée et gardée en cache par ui_loader.
+uiclass = load_ui_class("MainWindow.ui")
 
-class MainWindow(uiclass, baseclass):
+class MainWindow(uiclass, QMainWindow):
 	def __init__(self, *args, **kwargs):
 		super().__init__(*args, **kwargs)
 
-		self.eventbrite = EventbriteManager()
+		# Organisations et listes d'événements gardées sur disque : la connexion suivante n'attend pas le réseau.
+		self.eventbrite = EventbriteManager(ResponseCache("cache/eventbrite.json"))
 		self.nametag_gen = NametagGenerator()
+		# Les codes QR encodés sont aussi gardés sur disque, ce qui les partage avec les processus de génération et entre les sessions.
+		self.nametag_gen.qr_cache = QRCodeCache(disk_dir="cache/qr")
+		# Le réseau et la génération roulent hors du fil du GUI.
+		self.tasks = TaskRunner()
+		self.current_task = None
 
 		# Chargement du GUI
 		self.setupUi(self)
@@ -31,120 +43,344 @@ class MainWindow(uiclass, baseclass):
 		self.comboManualFilter.setItemData(3, "company")
 		self.groupAutoTemplate.setEnabled(False)
 		self.comboCustomGenerators.addItems(self.nametag_gen.get_custom_render_steps())
+		# La table des participants est une vue directement sur EventbriteManager.attendees.
+		self.attendees_model = AttendeeTableModel(self.eventbrite, self)
+		self.tableAttendees.setModel(self.attendees_model)
+		self.tableAttendees.setItemDelegateForColumn(AttendeeTableModel.STATUS_COLUMN, PrintStatusDelegate(self.tableAttendees))
+		self.tableAttendees.sortByColumn(0, Qt.AscendingOrder)
+		# Session journalisée : seuls les participants modifiés sont écrits, peu après chaque modification.
+		mkdir_if_not_there("sessions/")
+		self.session_store = SessionStore(DEFAULT_SESSION_PATH)
+		self.autosave_timer = QTimer(self)
+		self.autosave_timer.setSingleShot(True)
+		self.autosave_timer.setInterval(1000)
+		self.autosave_timer.timeout.connect(self.autosave_session)
+		self.attendees_model.dataChanged.connect(self.autosave_timer.start)
+		self.attendees_model.modelReset.connect(self.autosave_timer.start)
+		# Progression et annulation des tâches en arrière-plan, dans la barre d'état.
+		self.progressTask = QProgressBar()
+		self.progressTask.setMaximumWidth(200)
+		self.btnCancelTask = QPushButton("Annuler")
+		self.statusbar.addPermanentWidget(self.progressTask)
+		self.statusbar.addPermanentWidget(self.btnCancelTask)
+		# Mode surveillance : une synchro incrémentale à chaque intervalle, puis les nouvelles cocardes vont au spool.
+		self.watch_pipeline = None
+		self.watch_busy = False
+		self.watch_timer = QTimer(self)
+		self.watch_timer.timeout.connect(self.watch_tick)
+		self.set_busy(False)
 		# Connexion des signaux
-		self.btnConnectUser.clicked.connect(self.connect_user_from_input)
-		self.comboOrg.currentIndexChanged.connect(self.load_events_list_from_input)
+		self.btnConnectUser.clicked.connect(lambda: self.connect_user_from_input())
+		self.comboOrg.currentIndexChanged.connect(lambda: self.load_events_list_from_input())
 		self.btnLoadEvent.clicked.connect(self.load_event_data_from_input)
-		self.tableAttendees.cellChanged.connect(self.update_attendee_from_cells)
+		self.btnLoadEvents.clicked.connect(self.load_events_data_from_input)
+		self.btnRefreshEvents.clicked.connect(self.refresh_events_lists)
+		self.btnCancelTask.clicked.connect(self.cancel_current_task)
+		self.lineAttendeeFilter.textChanged.connect(self.attendees_model.set_filter_text)
+		self.lineAttendeeFilter.returnPressed.connect(self.select_filtered_attendee)
 		self.comboManualFilter.currentIndexChanged.connect(self.fill_manual_filter_table)
 		self.btnApplyManualReplacement.clicked.connect(self.apply_manual_replacement)
 		self.btnSelectDocTemplate.clicked.connect(self.load_doc_template_from_input)
 		self.btnGenerateNametags.clicked.connect(self.generate_nametags)
 		self.btnSaveSession.clicked.connect(self.quicksave_session)
-		self.btnLoadSession.clicked.connect(self.quickload_session)
+		self.btnLoadSession.clicked.connect(lambda: self.quickload_session())
+		self.btnRestoreSession.clicked.connect(self.restore_session_point)
+		self.chkWatchMode.toggled.connect(self.set_watch_mode)
+		self.spinWatchInterval.valueChanged.connect(lambda value: self.watch_timer.setInterval(value * 1000))
+		self.btnRefreshStats.clicked.connect(self.fill_stats_table)
+		self.btnResetStats.clicked.connect(self.reset_stats)
+		self.btnExportStats.clicked.connect(self.export_stats)
+
+	def start_task(self, message, func, *args, on_finished=None, background=False, **kwargs):
+		# Les widgets ne doivent être touchés que dans les fonctions on_*, qui sont appelées dans le fil du GUI.
+		if background:
+			# Une tâche de fond ne bloque pas l'interface, un échec est seulement signalé.
+			logging.info(f"Background task started: {message}")
+			return self.tasks.start(func, *args, on_finished=on_finished, on_failed=self.on_task_failed, **kwargs)
+		self.set_busy(True, message)
+		task = self.tasks.start(
+			func, *args,
+			on_finished=on_finished,
+			on_failed=self.on_task_failed,
+			on_progress=self.on_task_progress,
+			on_cancelled=lambda: self.statusbar.showMessage("Annulé", 5000),
+			on_done=self.on_task_done,
+			**kwargs
+		)
+		self.current_task = task
+		return task
+
+	def set_busy(self, busy, message=""):
+		# Le tableau des participants reste utilisable, seules les actions qui entreraient en conflit sont grisées.
+		connected = self.eventbrite.user is not None and self.eventbrite.user.ok
+		self.groupAuth.setEnabled(not busy)
+		self.groupEvent.setEnabled(not busy and connected)
+		self.btnSelectDocTemplate.setEnabled(not busy)
+		# La génération manuelle et le mode surveillance prendraient les mêmes participants.
+		self.btnGenerateNametags.setEnabled(not busy and self.watch_pipeline is None)
+		self.progressTask.setVisible(busy)
+		self.btnCancelTask.setVisible(busy)
+		if busy:
+			# Progression indéterminée jusqu'au premier rapport.
+			self.progressTask.setRange(0, 0)
+			self.statusbar.showMessage(message)
+
+	def on_task_progress(self, done, total):
+		self.progressTask.setRange(0, total)
+		self.progressTask.setValue(done)
+
+	def on_task_failed(self, error):
+		self.statusbar.showMessage(f"Erreur : {error}", 10000)
+
+	def on_task_done(self, task):
+		# Une tâche peut en démarrer une autre en finissant, on ne libère l'interface qu'à la fin de la dernière.
+		if self.current_task is task:
+			self.current_task = None
+			if self.statusbar.currentMessage() == "Annulation...":
+				self.statusbar.clearMessage()
+			self.set_busy(False)
+		self.fill_stats_table()
+
+	def cancel_current_task(self):
+		if self.current_task is not None:
+			self.current_task.cancel()
+			self.statusbar.showMessage("Annulation...")
+
+	def closeEvent(self, event):
+		self.set_watch_mode(False)
+		self.tasks.cancel_all()
+		self.tasks.wait()
+		self.autosave_timer.stop()
+		self.autosave_session()
+		self.session_store.close()
+		super().closeEvent(event)
 
 	# Connecte un utilisateur à partir de la clé d'API entrée dans le LineEdit.
 	def connect_user_from_input(self):
-		# Griser les boîtes et changer le texte de connexion
-		self.groupAuth.setEnabled(False)
-		self.groupEvent.setEnabled(False)
-		self.tableAttendees.clearContents()
-		self.tableAttendees.setRowCount(0)
 		self.lblConnectedUser.setText(f"Connexion...")
-		self.repaint()
-		# Authentifier avec la clé de API.
-		self.eventbrite.connect(self.lineApiKey.text())
-		if self.eventbrite.user is not None and self.eventbrite.user.ok:
-			self.lblConnectedUser.setText(f"Connecté en tant que {self.eventbrite.user['name']}")
-			self.groupEvent.setEnabled(True)
-			self.groupAuth.setEnabled(True)
-		else:
-			self.groupAuth.setEnabled(True)
+		# La réinitialisation remplace les participants et leurs index, lus par la table et l'autosauvegarde :
+		# elle se fait ici, dans le fil du GUI, et la tâche ne fait que le réseau.
+		self.eventbrite.reset()
+		self.fill_attendees_table()
+
+		def connect_and_fetch_orgs(task, api_key):
+			# Authentifier avec la clé de API.
+			self.eventbrite.connect(api_key, reset=False)
+			if self.eventbrite.user is None or not self.eventbrite.user.ok:
+				return None
+			orgs = self.eventbrite.fetch_orgs()
+			# Les listes d'événements de toutes les organisations, pour que changer d'organisation soit instantané.
+			self.eventbrite.prefetch_events([org["id"] for org in orgs])
+			return orgs
+
+		self.start_task(
+			"Connexion...", connect_and_fetch_orgs, self.lineApiKey.text(),
+			on_finished=self.on_user_connected
+		)
+
+	def on_user_connected(self, orgs):
+		if orgs is None:
 			self.lblConnectedUser.setText("Erreur de connexion")
 			return
+		self.lblConnectedUser.setText(f"Connecté en tant que {self.eventbrite.user['name']}")
+		self.fill_orgs_combo(orgs)
+		self.load_events_list_from_input()
 
+	def fill_orgs_combo(self, orgs, selected_org=None):
 		# Éviter les signaux redondants.
 		blocker = QSignalBlocker(self.comboOrg)
 		# Charger la liste des organisations existante pour l'utilisateur connecté
 		self.comboOrg.clear()
-		for org in self.eventbrite.fetch_orgs():
+		for org in orgs:
 			item_text = org["name"]
 			item_data = int(org["id"])
 			self.comboOrg.addItem(item_text, item_data)
-		# Sélectionner par défaut la première organisation.
-		self.comboOrg.setCurrentIndex(0)
-		self.load_events_list_from_input()
+		# Sélectionner l'organisation demandée, sinon la première.
+		self.comboOrg.setCurrentIndex(max(self.comboOrg.findData(selected_org), 0))
 
-	# Charge la liste d'événements associée à l'organisation sélectionnée dans le ComboBox.
-	def load_events_list_from_input(self):
-		selected_org = self.comboOrg.currentData()
+	def fill_events_combo(self, events, selected_event=None):
 		self.comboEvent.clear()
-		events = self.eventbrite.fetch_events(selected_org)
 		for ev in events:
 			item_text = ev["name"]["text"]
 			item_data = int(ev["id"])
 			self.comboEvent.addItem(item_text, item_data)
-		self.comboEvent.setCurrentIndex(0)
+		self.comboEvent.setCurrentIndex(max(self.comboEvent.findData(selected_event), 0))
+
+	# Charge la liste d'événements associée à l'organisation sélectionnée dans le ComboBox.
+	def load_events_list_from_input(self):
+		selected_org = self.comboOrg.currentData()
+		if selected_org is None:
+			return
+		self.comboEvent.clear()
+		# Déjà en cache (préchargée à la connexion) : pas besoin de passer par une tâche.
+		events = self.eventbrite.cached_events(selected_org)
+		if events is not None:
+			self.fill_events_combo(events)
+			return
+
+		def fetch_events(task, org_id):
+			return self.eventbrite.fetch_events(org_id)
+
+		self.start_task(
+			"Chargement des événements...", fetch_events, selected_org,
+			on_finished=lambda events: self.on_events_list_loaded(selected_org, events)
+		)
+
+	def on_events_list_loaded(self, org_id, events):
+		# Ignorer une réponse arrivée après un changement d'organisation.
+		if self.comboOrg.currentData() != org_id:
+			return
+		self.fill_events_combo(events)
+
+	# Oublie les réponses en cache et redemande les organisations et les événements, en gardant la sélection.
+	def refresh_events_lists(self):
+		self.eventbrite.refresh_cache()
+		if self.eventbrite.user is None:
+			return
+		org_id = self.comboOrg.currentData()
+		event_id = self.comboEvent.currentData()
+
+		def refetch(task, org_id):
+			orgs = self.eventbrite.fetch_orgs(refresh=True)
+			org_ids = [org["id"] for org in orgs]
+			if org_id is not None and str(org_id) in org_ids:
+				# L'organisation affichée d'abord, les autres ensuite en parallèle.
+				events = self.eventbrite.fetch_events(org_id, refresh=True)
+			else:
+				events = None
+			self.eventbrite.prefetch_events(org_ids)
+			return orgs, events
+
+		self.start_task(
+			"Rafraîchissement des événements...", refetch, org_id,
+			on_finished=lambda result: self.on_events_lists_refreshed(*result, org_id, event_id)
+		)
+
+	def on_events_lists_refreshed(self, orgs, events, org_id, event_id):
+		self.fill_orgs_combo(orgs, org_id)
+		if events is not None and self.comboOrg.currentData() == org_id:
+			self.fill_events_combo(events, event_id)
+		else:
+			self.load_events_list_from_input()
 
 	# Charge les données de base d'un événement ainsi que sa liste de participant.
 	def load_event_data_from_input(self):
-		self.sync_data_from_att_table()
-		# Charger les infos de l'événements
+		if self.comboEvent.currentData() is None:
+			return
 		new_event_id = int(self.comboEvent.currentData())
-		self.eventbrite.load_event(new_event_id)
-		event = self.eventbrite.event
-		self.lblEventID.setText(event["id"])
-		self.lblEventName.setText(event["name"]["text"])
-		self.lblEventDate.setText(event["start"]["local"])
-		# Charger et mettre à jour les participants
-		new_attendees = self.eventbrite.download_attendees()
-		self.eventbrite.update_attendees(new_attendees, self.chkOverwrite.isChecked())
+		overwrite = self.chkOverwrite.isChecked()
+		self.start_task(
+			"Téléchargement des participants...", self.download_event, new_event_id, self.chkDeltaSync.isChecked(),
+			on_finished=lambda result: self.on_event_downloaded(*result, overwrite)
+		)
+
+	# Plusieurs événements (jours, ateliers) dans la même liste de participants, avec une cocarde par personne.
+	def load_events_data_from_input(self):
+		items = [(self.comboEvent.itemText(i), self.comboEvent.itemData(i)) for i in range(self.comboEvent.count())]
+		checked = [int(event_id) for event_id in self.eventbrite.events] or [self.comboEvent.currentData()]
+		event_ids = choose_items(self, "Charger plusieurs événements", "Événements à charger ensemble :", items, checked)
+		if not event_ids:
+			return
+		self.start_events_download(event_ids)
+
+	def start_events_download(self, event_ids, background=False):
+		overwrite = self.chkOverwrite.isChecked()
+		delta = self.chkDeltaSync.isChecked()
+
+		def download_events(task):
+			return self.eventbrite.download_events(event_ids, delta, progress=task.report_progress)
+
+		self.start_task(
+			"Téléchargement des participants...", download_events, background=background,
+			on_finished=lambda downloads: self.on_events_downloaded(downloads, overwrite)
+		)
+
+	def on_events_downloaded(self, downloads, overwrite):
+		self.eventbrite.merge_downloaded_events(downloads, overwrite)
+		self.show_event_info()
 		self.fill_attendees_table()
+		self.prefetch_qr_codes()
+
+	def download_event(self, task, event_id, delta):
+		# Seulement du réseau ici : la fusion dans EventbriteManager se fait dans le fil du GUI.
+		event = self.eventbrite.fetch_event(event_id)
+		watermark = self.eventbrite.sync_watermarks.get(event["id"]) if delta else None
+		new_attendees = self.eventbrite.download_attendees(
+			progress=task.report_progress, changed_since=watermark, event_id=event["id"]
+		)
+		return event, new_attendees, watermark
+
+	def on_event_downloaded(self, event, new_attendees, watermark, overwrite):
+		# Charger les infos de l'événements
+		self.eventbrite.set_event(event)
+		self.show_event_info()
+		# Mettre à jour les participants (seulement ceux modifiés depuis le dernier chargement en mode incrémental)
+		self.eventbrite.merge_synced_attendees(new_attendees, overwrite, watermark)
+		self.fill_attendees_table()
+		self.prefetch_qr_codes()
+
+	def show_event_info(self):
+		events = list(self.eventbrite.events.values()) or [self.eventbrite.event]
+		self.lblEventID.setText(", ".join(event["id"] for event in events))
+		self.lblEventName.setText(" + ".join(event["name"]["text"] for event in events))
+		self.lblEventDate.setText(events[0]["start"]["local"])
+
+	def reconnect_in_background(self, org_id, event_id):
+		# Après une restauration hors ligne : se reconnecter puis rafraîchir les participants sans bloquer l'interface.
+		self.lblConnectedUser.setText("Session restaurée, reconnexion en arrière-plan...")
+
+		def reconnect(task, api_key, org_id):
+			# Sans reset, les participants restaurés restent en place pendant la reconnexion.
+			self.eventbrite.connect(api_key, reset=False)
+			if self.eventbrite.user is None or not self.eventbrite.user.ok:
+				return None
+			return self.eventbrite.fetch_orgs(), self.eventbrite.fetch_events(org_id)
+
+		self.start_task(
+			"Reconnexion", reconnect, self.lineApiKey.text(), org_id, background=True,
+			on_finished=lambda result: self.on_reconnected(result, org_id, event_id)
+		)
+
+	def on_reconnected(self, result, org_id, event_id):
+		if result is None:
+			self.lblConnectedUser.setText("Hors ligne (session restaurée)")
+			return
+		orgs, events = result
+		self.lblConnectedUser.setText(f"Connecté en tant que {self.eventbrite.user['name']}")
+		self.fill_orgs_combo(orgs, org_id)
+		self.fill_events_combo(events, event_id)
+		self.groupEvent.setEnabled(self.current_task is None)
+		# Rafraîchissement incrémental depuis le dernier filigrane de la session.
+		if self.eventbrite.multi_event:
+			self.start_events_download(list(self.eventbrite.events), background=True)
+			return
+		overwrite = self.chkOverwrite.isChecked()
+		self.start_task(
+			"Rafraîchissement des participants", self.download_event, event_id, self.chkDeltaSync.isChecked(), background=True,
+			on_finished=lambda result: self.on_event_downloaded(*result, overwrite)
+		)
+
+	def prefetch_qr_codes(self):
+		# Encoder les codes QR en arrière-plan pendant qu'on prépare le gabarit.
+		self.nametag_gen.qr_cache.prefetch([att.barcode for att in self.eventbrite.attendees.values()])
 
 	def fill_attendees_table(self):
-		# D'abord déconnecter le signal qui est redondant (voir récursif)
-		blocker = QSignalBlocker(self.tableAttendees)
-		# Mettre à jour la table de participants
-		table = self.tableAttendees
-		table.clearContents()
-		# Faut désactiver le tri auto durant la modification de la table
-		table.sortItems(-1)
-		table.setRowCount(len(self.eventbrite.attendees))
-		for i, att in enumerate(self.eventbrite.attendees.values()):
-			# Les colonnes de la rangée actuelle
-			table.setItem(i, 0, QTableWidgetItem(att.attendee_id))
-			table.setItem(i, 1, QTableWidgetItem(att.first_name.strip()))
-			table.setItem(i, 2, QTableWidgetItem(att.last_name.strip()))
-			table.setItem(i, 3, QTableWidgetItem(att.position.strip()))
-			table.setItem(i, 4, QTableWidgetItem(att.company.strip()))
-			# La dernière colonne est un combo box indiquant le status d'impression
-			printedCell = QComboBox()
-			printedCell.addItems(["Oui", "Non", "Exclu"])
-			printedCell.setCurrentIndex(att.printing_status)
-			table.setCellWidget(i, 5, printedCell)
-			# Configurer la première colonne (le ID) pour être lecture seule, vu que briserait trop de chose de laisser le ID éditable.
-			table.item(i, 0).setFlags(table.item(i, 0).flags() & ~Qt.ItemIsEditable)
-		table.sortItems(0)
+		# Le modèle lit directement les objets Attendee, il suffit de le réinitialiser quand la liste change.
+		self.attendees_model.refresh()
 
-	def update_attendee_from_cells(self, row, column):
-		table = self.tableAttendees
-		attendee_id = table.item(row, 0).text()
-		attendee = self.eventbrite.attendees.get(attendee_id, None)
-		if attendee is None:
-			logging.warning(f"Attendee {attendee_id} is in table but not in Eventbrite data.")
+	def select_filtered_attendee(self):
+		# Une douchette tape le code-barres puis Entrée : le participant trouvé est sélectionné pour l'accueil.
+		if self.attendees_model.rowCount() == 0:
+			self.statusbar.showMessage("Aucun participant trouvé", 5000)
 			return
-		attendee.first_name = table.item(row, 1).text()
-		attendee.last_name = table.item(row, 2).text()
-		attendee.position = table.item(row, 3).text()
-		attendee.company = table.item(row, 4).text()
-		attendee.printing_status = PrintStatus(table.cellWidget(row, 5).currentIndex())
-
-	def sync_data_from_att_table(self):
-		for i in range(self.tableAttendees.rowCount()):
-			cell_item = self.tableAttendees.item(i, 0)
-			# Rien à faire si la cellule n'existe pas (différente de vide)
-			if cell_item is not None:
-				self.update_attendee_from_cells(i, 0)
+		att = self.eventbrite.find_by_barcode(self.lineAttendeeFilter.text())
+		row = self.attendees_model.rows_by_id.get(att.attendee_id, 0) if att is not None else 0
+		self.tableAttendees.selectRow(row)
+		self.tableAttendees.scrollTo(self.attendees_model.index(row, 0))
+		if att is None and self.attendees_model.rowCount() == 1:
+			att = self.attendees_model.attendee_at(0)
+		if att is not None:
+			self.statusbar.showMessage(f"{att.first_name} {att.last_name} ({att.company})", 10000)
 
 	def fill_manual_filter_table(self):
 		# Le 'data' du combobox est le nom du champs dans le dataclass Attendee
@@ -154,11 +390,8 @@ class MainWindow(uiclass, baseclass):
 			self.tableManualFilter.setRowCount(0)
 			return
 
-		values = {}
-		for att_id, att in self.eventbrite.attendees.items():
-			if att[prop] not in values:
-				values[att[prop]] = 0
-			values[att[prop]] += 1
+		# Les comptes viennent de l'index inversé d'EventbriteManager, pas besoin de parcourir les participants.
+		values = self.eventbrite.get_value_counts(prop)
 
 		table = self.tableManualFilter
 		table.clearContents()
@@ -168,6 +401,8 @@ class MainWindow(uiclass, baseclass):
 		for i, co in enumerate(values.items()):
 			name, num_atts = co
 			table.setItem(i, 0, QTableWidgetItem(name.strip()))
+			# Garder la valeur exacte pour retrouver les participants dans l'index.
+			table.item(i, 0).setData(Qt.UserRole, name)
 			table.setItem(i, 1, QTableWidgetItem(str(num_atts)))
 			table.setItem(i, 2, QTableWidgetItem(""))
 			# Seulement la valeur de remplacement doit être éditable.
@@ -182,17 +417,18 @@ class MainWindow(uiclass, baseclass):
 		table = self.tableManualFilter
 		# Faut désactiver le tri auto durant la modification de la table
 		table.sortItems(-1)
+		replacements = {}
 		for i in range(table.rowCount()):
 			name_cell = table.item(i, 0)
 			replace_cell = table.item(i, 2)
 			# Laisser la cellule de remplacement vide ne fait aucun remplacement.
 			if replace_cell is None or replace_cell.text().strip() == "":
 				continue
-			for att in self.eventbrite.attendees.values():
-				if att[prop] == name_cell.text().strip():
-					att[prop] = replace_cell.text().strip()
-		# Plus fiable de reconstruire les tables, même si un peu lent.
-		self.fill_attendees_table()
+			replacements[name_cell.data(Qt.UserRole)] = replace_cell.text().strip()
+		# Les remplacements sont gardés comme règles et réappliqués aux participants des prochaines synchros.
+		changed_ids = self.eventbrite.apply_replacements(prop, replacements)
+		# Seules les rangées touchées sont rafraîchies, la table de filtre n'a qu'une rangée par valeur distincte.
+		self.attendees_model.attendees_changed(changed_ids)
 		self.fill_manual_filter_table()
 
 	def load_doc_template_from_input(self):
@@ -218,16 +454,18 @@ class MainWindow(uiclass, baseclass):
 			combo = QComboBox()
 			combo.setEditable(True)
 			combo.setPlaceholderText("Entrez un texte ou sélectionner une propriété")
-			attendee_fields = list(Attendee.__dataclass_fields__.keys())
+			attendee_fields = Attendee.field_names()
 			for name in attendee_fields:
 				combo.addItem(f"Attendee.{name}", name)
+			# Les événements de la personne, pour les cocardes multi-événements.
+			for name in EventbriteManager.BADGE_FIELDS:
+				combo.addItem(f"Badge.{name}", name)
 			table.setCellWidget(i, 1, combo)
 			table.setItem(i, 2, QTableWidgetItem(("")))
 			table.item(i, 0).setFlags(table.item(i, 0).flags() & ~Qt.ItemIsEditable)
 		table.sortItems(0)
 
 	def generate_nametags(self):
-		self.sync_data_from_att_table()
 		self.sync_nametag_context_from_table()
 
 		custom_steps = []
@@ -235,14 +473,170 @@ class MainWindow(uiclass, baseclass):
 			custom_steps = [self.comboCustomGenerators.currentText()]
 
 		mkdir_if_not_there("output/")
-		self.sync_data_from_att_table()
-		for att_id, att in self.eventbrite.attendees.items():
-			if att.printing_status == PrintStatus.UNPRINTED:
-				self.nametag_gen.generate_nametag(att, f"output/{att_id}_nametag.docx", custom_steps)
-				if self.checkMarkPrinted.isChecked():
-					att.printing_status = PrintStatus.PRINTED
-		# On a changé les états d'impression, donc on réaffiche la table.
-		self.fill_attendees_table()
+		# Des copies des participants, pour pouvoir continuer à éditer la table pendant la génération.
+		# En mode multi-événements, une seule cocarde par personne.
+		jobs = [
+			(att_id, data, f"output/{att_id}_nametag.docx")
+			for att_id, data in self.eventbrite.nametag_data()
+		]
+		merged = self.chkMergedOutput.isChecked()
+		batch_size = self.spinMergedBatchSize.value()
+		mark_printed = self.checkMarkPrinted.isChecked()
+		prefix = f"output/{format_datetime()}_cocardes"
+		profile_path = None
+		if self.chkProfileNextBatch.isChecked():
+			# Seulement pour un lot, puis on revient à la génération normale.
+			self.chkProfileNextBatch.setChecked(False)
+			mkdir_if_not_there("logs/")
+			profile_path = f"logs/{format_datetime()}_profile.prof"
+
+		def generate(task):
+			if profile_path is not None:
+				# cProfile ne voit pas les processus de génération, donc tout se fait dans ce fil.
+				with profile_to(profile_path):
+					return generate_batch(task, max_workers=1)
+			return generate_batch(task)
+
+		def generate_batch(task, **options):
+			# Une annulation saute les lots pas encore commencés, les cocardes déjà faites sont quand même retournées.
+			options.update(progress=task.signals.progress.emit, cancelled=lambda: task.is_cancelled)
+			if merged:
+				# Quelques gros documents et un index attendee_id -> document, page.
+				return self.nametag_gen.generate_merged_nametags(
+					jobs, prefix + "_{:03d}.docx", batch_size, custom_steps,
+					index_filepath=prefix + "_index.csv", **options
+				)
+			return self.nametag_gen.generate_nametags(jobs, custom_steps, **options)
+
+		self.start_task(
+			"Génération des cocardes...", generate,
+			on_finished=lambda results: self.on_nametags_generated(results, mark_printed)
+		)
+
+	def on_nametags_generated(self, results, mark_printed):
+		# Seules les cocardes réellement générées changent d'état.
+		failed = [r for r in results if r.error is not None]
+		printed = [r.attendee_id for r in results if r.error is None and r.attendee_id in self.eventbrite.attendees]
+		if mark_printed:
+			# Toutes les inscriptions des personnes imprimées.
+			changed = self.eventbrite.set_people_printing_status(printed, PrintStatus.PRINTED)
+			# On a changé les états d'impression, donc on rafraîchit ces rangées (ce qui déclenche la sauvegarde).
+			self.attendees_model.attendees_changed(changed)
+		if failed:
+			logging.warning(f"{len(failed)} nametags could not be generated")
+		self.statusbar.showMessage(f"{len(results) - len(failed)} cocardes générées, {len(failed)} erreurs", 10000)
+
+	def set_watch_mode(self, enabled):
+		if not enabled:
+			self.watch_timer.stop()
+			if self.watch_pipeline is not None:
+				self.watch_pipeline.stop()
+				self.watch_pipeline = None
+				self.statusbar.showMessage("Surveillance arrêtée", 5000)
+			self.set_busy(self.current_task is not None)
+			return
+		if self.eventbrite.event is None or self.nametag_gen.doc is None:
+			logging.warning("Watch mode needs a loaded event and a nametag template")
+			self.chkWatchMode.setChecked(False)
+			return
+		self.sync_nametag_context_from_table()
+		custom_steps = [self.comboCustomGenerators.currentText()] if self.comboCustomGenerators.currentIndex() != 0 else []
+		self.watch_pipeline = WatchPipeline(
+			self.eventbrite, self.nametag_gen, "spool", custom_steps, overwrite_profiles=self.chkOverwrite.isChecked()
+		)
+		self.watch_pipeline.recover()
+		self.set_busy(self.current_task is not None)
+		self.watch_timer.start(self.spinWatchInterval.value() * 1000)
+		self.statusbar.showMessage("Surveillance des inscriptions", 5000)
+		self.watch_tick()
+
+	def watch_tick(self):
+		# Un seul cycle à la fois : si le précédent n'est pas fini, on attend le prochain intervalle.
+		if self.watch_busy or self.watch_pipeline is None or self.eventbrite.api is None:
+			return
+		self.watch_busy = True
+		pipeline = self.watch_pipeline
+
+		def fetch(task):
+			try:
+				return pipeline.fetch()
+			except Exception as e:
+				logging.warning(f"Watch mode could not sync attendees: {e}")
+				return None
+
+		self.start_task("Surveillance", fetch, background=True, on_finished=lambda result: self.on_watch_fetched(pipeline, result))
+
+	def on_watch_fetched(self, pipeline, result):
+		if pipeline is not self.watch_pipeline:
+			self.watch_busy = False
+			return
+		if result is not None:
+			pipeline.merge(result)
+			self.fill_attendees_table()
+		self.watch_generate(pipeline)
+
+	def watch_generate(self, pipeline):
+		if pipeline is not self.watch_pipeline:
+			self.watch_busy = False
+			return
+		jobs = pipeline.next_jobs()
+		if not jobs:
+			if pipeline.spooled_count() >= pipeline.max_spooled:
+				# Spool plein : on attend que l'imprimante prenne des cocardes.
+				QTimer.singleShot(int(SPOOL_CHECK_INTERVAL * 1000), lambda: self.watch_generate(pipeline))
+			else:
+				self.watch_busy = False
+			return
+		def render(task):
+			return pipeline.render(jobs, lambda: task.is_cancelled)
+
+		self.start_task("Surveillance", render, background=True, on_finished=lambda results: self.on_watch_rendered(pipeline, jobs, results))
+
+	def on_watch_rendered(self, pipeline, jobs, results):
+		done, changed = pipeline.commit(jobs, results)
+		self.attendees_model.attendees_changed(changed)
+		# La session doit savoir ces cocardes imprimées avant qu'elles n'arrivent à l'imprimante.
+		self.autosave_session()
+		pipeline.publish(done)
+		if done:
+			self.statusbar.showMessage(f"{len(done)} cocardes envoyées au spool", 5000)
+		self.watch_generate(pipeline)
+
+	def fill_stats_table(self):
+		quota = self.eventbrite.quota()
+		if quota is not None:
+			self.lblApiQuota.setText(
+				f"API Eventbrite : {quota['used_last_hour']}/{quota['hourly_limit']} requêtes dans la dernière heure, "
+				f"{quota['retries']} reprises dont {quota['rate_limited']} pour quota dépassé"
+			)
+		table = self.tableStats
+		rows = metrics.summary()
+		table.setRowCount(len(rows))
+		for i, row in enumerate(rows):
+			values = [
+				row["stage"],
+				str(row["count"]),
+				f"{row['total']:.2f}",
+				f"{row['mean'] * 1000:.1f}",
+				f"{row['p50'] * 1000:.1f}",
+				f"{row['p95'] * 1000:.1f}",
+				f"{row['max'] * 1000:.1f}",
+				str(row["bytes"]) if row["bytes"] else "",
+			]
+			for j, value in enumerate(values):
+				table.setItem(i, j, QTableWidgetItem(value))
+
+	def reset_stats(self):
+		metrics.reset()
+		self.fill_stats_table()
+
+	def export_stats(self):
+		filepath, _ = QFileDialog.getSaveFileName(
+			self, "Exporter les statistiques", f"logs/{format_datetime()}_metrics.json", "JSON (*.json);;CSV (*.csv)"
+		)
+		if filepath:
+			metrics.export(filepath)
+			self.statusbar.showMessage(f"Statistiques exportées dans {filepath}", 5000)
 
 	def sync_nametag_context_from_table(self):
 		table = self.tableDocVariables
@@ -257,68 +651,104 @@ class MainWindow(uiclass, baseclass):
 			else:
 				self.nametag_gen.add_context_entry(var_name, False, combo_txt)
 
-	def quicksave_session(self):
-		# Syncro avec la table (juste au cas)
-		self.sync_data_from_att_table()
-		self.sync_nametag_context_from_table()
-		session_data = {
-			"api_key": self.eventbrite.api.oauth_token,
-			"event": self.eventbrite.event,
-			"attendees": self.eventbrite.serialize_attendees(),
-			"nametag_template": self.nametag_gen.doc.template_file,
+	def session_meta(self):
+		return {
+			**self.eventbrite.session_meta(),
+			"api_key": self.eventbrite.api.oauth_token if self.eventbrite.api is not None else self.lineApiKey.text(),
+			"nametag_template": self.nametag_gen.doc.template_file if self.nametag_gen.doc is not None else None,
 			"template_context": self.nametag_gen.basic_context,
 			"custom_nametag_step": self.comboCustomGenerators.currentIndex()
 		}
 
-		mkdir_if_not_there("sessions/")
-		backup_filename = f"sessions/{format_datetime()}_quicksave.json"
-		json.dump(session_data, open("sessions/quicksave.json", "w"), indent=2)
-		shutil.copy2("sessions/quicksave.json", backup_filename)
-		logging.info(f"Saved session to sessions/quicksave.json")
-
-	def quickload_session(self):
-		try:
-			# Chargement de la session
-			session_data = json.load(open("sessions/quicksave.json"))
-			logging.info(f"Loaded session from sessions/quicksave.json")
-
-			# Connexion et chargement de l'événement
-			self.lineApiKey.setText(session_data["api_key"])
-			self.lineApiKey.repaint()
-			self.connect_user_from_input()
-			for i in range(self.comboOrg.count()):
-				if self.comboOrg.itemData(i) == int(session_data["event"]["organization_id"]):
-					self.comboOrg.setCurrentIndex(i)
-					break
-			for i in range(self.comboEvent.count()):
-				if self.comboEvent.itemData(i) == int(session_data["event"]["id"]):
-					self.comboEvent.setCurrentIndex(i)
-					break
-
-			# Chargement des participants
-			self.eventbrite.event = session_data["event"]
-			self.eventbrite.load_serialized_attendees(session_data["attendees"])
-			self.fill_attendees_table()
-			self.comboManualFilter.setCurrentIndex(-1)
-
-			# Chargement du gabarit de cocarde et des variables de remplacement
-			self.load_doc_template(session_data["nametag_template"])
-			context = session_data["template_context"]
-			self.nametag_gen.basic_context = {k: TemplateVariableValue(*v) for k , v in context.items()}
-			table = self.tableDocVariables
-			for k, v in self.nametag_gen.basic_context.items():
-				for i in range(table.rowCount()):
-					if table.item(i, 0).text() == k:
-						cell = table.cellWidget(i, 1)
-						if v.is_key:
-							index = cell.findData(v.value)
-							cell.setCurrentIndex(index)
-						else:
-							cell.setCurrentIndex(-1)
-							cell.setCurrentText(v.value)
-							cell.setEditText(v.value)
-			self.comboCustomGenerators.setCurrentIndex(session_data["custom_nametag_step"])
-			self.groupAutoTemplate.setEnabled(True)
-		except FileNotFoundError:
-			logging.error(f"Could not load session from sessions/quicksave.json")
+	def save_session(self):
+		dirty_ids, dirty_payload_ids = self.eventbrite.take_dirty()
+		event_id = self.eventbrite.event["id"] if self.eventbrite.event is not None else None
+		return self.session_store.save(self.session_meta(), event_id, self.eventbrite.attendees, dirty_ids, dirty_payload_ids)
+
+	def autosave_session(self):
+		# Rien à sauvegarder tant qu'aucun événement n'est chargé.
+		if self.eventbrite.event is None:
+			return
+		self.save_session()
 
+	def quicksave_session(self):
+		if self.eventbrite.event is None:
+			logging.warning("No event loaded, session not saved")
+			return
+		# Syncro avec la table des variables (juste au cas)
+		self.sync_nametag_context_from_table()
+		count = self.save_session()
+		logging.info(f"Saved session to {self.session_store.filepath} ({count} changed attendees)")
+
+	def quickload_session(self, at=None):
+		# Chargement de la session, la plus récente ou telle qu'elle était au moment 'at'.
+		session_data = self.session_store.load(at)
+		from_legacy = False
+		if session_data is None:
+			try:
+				# Ancienne sauvegarde JSON, importée dans la session journalisée une fois restaurée.
+				session_data = json.load(open("sessions/quicksave.json"))
+				from_legacy = True
+			except FileNotFoundError:
+				logging.error(f"Could not load session from {self.session_store.filepath}")
+				return
+		if session_data.get("event") is None:
+			logging.error(f"Session in {self.session_store.filepath} has no event")
+			return
+		logging.info(f"Loaded session with {len(session_data['attendees'])} attendees")
+
+		# Tout est restauré à partir de la session, sans attendre Eventbrite.
+		self.lineApiKey.setText(session_data["api_key"])
+		self.restore_session_data(session_data, at is not None or from_legacy, from_legacy, None if from_legacy else at)
+		# La reconnexion et le rafraîchissement se font ensuite en arrière-plan.
+		self.reconnect_in_background(int(session_data["event"]["organization_id"]), int(session_data["event"]["id"]))
+
+	def restore_session_point(self):
+		revisions = self.session_store.revisions()
+		if not revisions:
+			self.statusbar.showMessage("Aucune session sauvegardée", 5000)
+			return
+		items = [f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts))} ({count} participants modifiés)" for ts, count in revisions]
+		item, ok = QInputDialog.getItem(self, "Restaurer la session", "Restaurer la session telle qu'elle était le :", items, 0, False)
+		if ok:
+			self.quickload_session(revisions[items.index(item)][0])
+
+	def restore_session_data(self, session_data, resave=False, include_payloads=False, restored_at=None):
+		# Chargement de l'événement et des participants
+		self.eventbrite.load_session_data(session_data)
+		self.show_event_info()
+		self.fill_attendees_table()
+		self.prefetch_qr_codes()
+		self.comboManualFilter.setCurrentIndex(-1)
+
+		# Chargement du gabarit de cocarde et des variables de remplacement
+		if session_data["nametag_template"] is not None:
+			self.restore_template_settings(session_data)
+
+		# Une session restaurée d'un moment passé ou de l'ancien format devient la plus récente. Un moment passé est
+		# marqué comme restauré dans le journal, l'ancien format y est écrit en entier.
+		if resave:
+			if restored_at is not None:
+				self.session_store.restore(restored_at)
+			else:
+				self.eventbrite.mark_all_dirty(include_payloads)
+			self.save_session()
+
+	def restore_template_settings(self, session_data):
+		self.load_doc_template(session_data["nametag_template"])
+		context = session_data["template_context"]
+		self.nametag_gen.basic_context = {k: TemplateVariableValue(*v) for k , v in context.items()}
+		table = self.tableDocVariables
+		for k, v in self.nametag_gen.basic_context.items():
+			for i in range(table.rowCount()):
+				if table.item(i, 0).text() == k:
+					cell = table.cellWidget(i, 1)
+					if v.is_key:
+						index = cell.findData(v.value)
+						cell.setCurrentIndex(index)
+					else:
+						cell.setCurrentIndex(-1)
+						cell.setCurrentText(v.value)
+						cell.setEditText(v.value)
+		self.comboCustomGenerators.setCurrentIndex(session_data["custom_nametag_step"])
+		self.groupAutoTemplate.setEnabled(True)
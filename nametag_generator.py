@@ -1,14 +1,20 @@
 import sys
 import logging
 from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import math
 import os
+import io
+import csv
+import json
+import shutil
+import hashlib
 import inspect
 
-import docxtpl
-import qrcode
-import png
-
 from utils import *
+from qr_cache import QRCodeCache
+from output_manifest import OutputManifest, file_hash
+from instrumentation import metrics
 
 
 TemplateVariableValue = namedtuple("TemplateVariableValue", """
@@ -16,7 +22,39 @@ TemplateVariableValue = namedtuple("TemplateVariableValue", """
 	value
 """)
 
+# En mode document combiné, filepath est le document qui contient la cocarde et page son numéro de page.
+NametagResult = namedtuple("NametagResult", """
+	attendee_id
+	filepath
+	error
+	page
+""", defaults=(None,))
+
+
+# Générateur propre à chaque processus de travail, pour ne charger le gabarit qu'une seule fois par processus.
+_worker_generator = None
+
+def _init_worker(generator_class, engine, qr_cache, template_file, basic_context):
+	global _worker_generator
+	# Avec fork, le processus hérite des mesures du parent, qui les a déjà.
+	metrics.reset()
+	_worker_generator = generator_class()
+	_worker_generator.engine = engine
+	_worker_generator.qr_cache = qr_cache
+	_worker_generator.load_template(template_file)
+	_worker_generator.basic_context = basic_context
+
+def _run_shard(method_name, *args):
+	# Les mesures du lot sont renvoyées avec ses résultats pour être fusionnées dans celles du processus principal.
+	return getattr(_worker_generator, method_name)(*args), metrics.take_snapshot()
+
+
 class NametagGenerator:
+	# auto : rendu rapide par substitution si le gabarit n'a que des {{ variables }}, sinon le gabarit Jinja compilé.
+	ENGINES = ["auto", "fast", "compiled", "docxtpl"]
+	# Champs qui ne changent rien au document, ignorés dans l'empreinte d'une cocarde.
+	UNRENDERED_FIELDS = ["printing_status", "changed"]
+
 	@staticmethod
 	def render_step(func):
 		func.is_custom_step = True
@@ -24,6 +62,11 @@ class NametagGenerator:
 
 	def __init__(self):
 		self.doc = None
+		self.template_hash = None
+		self.compiled = None
+		self.engine = "auto"
+		self.use_fast_path = False
+		self.qr_cache = QRCodeCache()
 		self.reset_basic_context()
 		
 		funcs = inspect.getmembers(
@@ -33,8 +76,19 @@ class NametagGenerator:
 		self.render_step_functions = dict(funcs)
 
 	def load_template(self, filepath):
+		# docxtpl et ses dépendances sont lents à importer, on attend le premier gabarit plutôt que le démarrage.
+		import docxtpl
+		from template_cache import CompiledTemplate
 		self.doc = docxtpl.DocxTemplate(filepath)
+		# Le contenu du gabarit fait partie de l'empreinte des cocardes générées, voir nametag_hash.
+		self.template_hash = file_hash(filepath)
+		# Analyser le docx et compiler les gabarits Jinja une seule fois plutôt qu'à chaque cocarde.
+		self.compiled = CompiledTemplate(self.doc)
+		self.use_fast_path = self.engine in ("auto", "fast") and self.compiled.is_simple
+		if self.engine == "fast" and not self.use_fast_path:
+			logging.warning(f"Template {filepath} uses loops or conditions, falling back to the compiled Jinja renderer")
 		logging.info(f"Loaded Word template {filepath}")
+		logging.debug(f"Render engine: {self.engine}, fast path {'enabled' if self.use_fast_path else 'disabled'}")
 
 	def get_template_variables(self):
 		return self.doc.get_undeclared_template_variables()
@@ -48,28 +102,221 @@ class NametagGenerator:
 	def add_context_entry(self, variable_name, is_key, value):
 		self.basic_context[variable_name] = TemplateVariableValue(is_key, value)
 
-	def generate_nametag(self, data, filepath, render_steps=[]):
+	def build_context(self, data, filepath, render_steps=[]):
 		self.doc.reset_replacements()
 
 		for step in render_steps:
-			self.render_step_functions[step](data, filepath)
+			with metrics.stage(f"step.{step}"):
+				self.render_step_functions[step](data, filepath)
+
+		return self.resolve_context(data)
 
+	def resolve_context(self, data):
 		context = {}
 		for k, v in self.basic_context.items():
 			context[k] = data[v.value] if v.is_key else v.value
-		self.doc.render(context, autoescape=True)
-		self.doc.save(filepath)
+		return context
+
+	def nametag_hash(self, data, render_steps=[]):
+		# Tout ce dont dépend le document : gabarit, moteur, valeurs des variables et étapes de rendu.
+		key = {
+			"template": self.template_hash,
+			"engine": self.engine,
+			"context": self.resolve_context(data),
+			"steps": list(render_steps),
+			# Taille, marge et correction d'erreur changent l'image des codes QR.
+			"qr_params": self.qr_cache.qr_params,
+		}
+		if render_steps:
+			# Les étapes peuvent lire n'importe quel champ (le code-barres pour add_qr_code).
+			fields = data.serialize(include_payload=False) if hasattr(data, "serialize") else data
+			key["data"] = {k: v for k, v in fields.items() if k not in self.UNRENDERED_FIELDS}
+		encoded = json.dumps(key, sort_keys=True, ensure_ascii=False, default=str)
+		return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+	def generate_nametag(self, data, filepath, render_steps=[]):
+		with metrics.stage("nametag"):
+			context = self.build_context(data, filepath, render_steps)
+			if self.engine == "docxtpl":
+				with metrics.stage("render"):
+					self.doc.render(context, autoescape=True)
+				with metrics.stage("write") as timing:
+					self.doc.save(filepath)
+					timing.bytes = os.path.getsize(filepath)
+			else:
+				self.compiled.render(context, filepath, self.use_fast_path)
 		logging.info(f"Generated nametag {filepath}")
 
-	def generate_qrcode(self, data, filepath):
-		img = qrcode.make(data)
-		img.save(filepath)
-		logging.info(f"Generated QR code {filepath}")
+	def generate_batch(self, jobs, render_steps=[]):
+		# Chaque job est un tuple (attendee_id, data, filepath). Une erreur n'interrompt pas le reste du lot.
+		results = []
+		for att_id, data, filepath in jobs:
+			try:
+				self.generate_nametag(data, filepath, render_steps)
+				results.append(NametagResult(att_id, filepath, None))
+			except Exception as e:
+				logging.error(f"Could not generate nametag {filepath}: {e}")
+				results.append(NametagResult(att_id, filepath, f"{type(e).__name__}: {e}"))
+		return results
+
+	def generate_merged_batch(self, jobs, filepath, render_steps=[]):
+		# Toutes les cocardes du lot vont dans le même document, une par section.
+		results = []
+		from template_cache import MergedDocumentWriter
+		with MergedDocumentWriter(self.compiled, filepath, self.use_fast_path) as writer:
+			for att_id, data, job_filepath in jobs:
+				try:
+					with metrics.stage("nametag"):
+						page = writer.add(self.build_context(data, job_filepath, render_steps))
+					results.append(NametagResult(att_id, filepath, None, page))
+				except Exception as e:
+					logging.error(f"Could not add nametag of {att_id} to {filepath}: {e}")
+					results.append(NametagResult(att_id, filepath, f"{type(e).__name__}: {e}"))
+		logging.info(f"Generated merged nametags document {filepath} ({writer.count} nametags)")
+		return results
+
+	def run_shards(self, method_name, shards, total, max_workers, progress=None, cancelled=None):
+		# Chaque fragment est un tuple d'arguments pour method_name, dont le premier est la liste de jobs.
+		# Si cancelled() devient vrai, les fragments pas encore commencés sont abandonnés et on retourne les résultats partiels.
+		results = []
+		def add_failed_shard(shard, e):
+			logging.error(f"Nametag worker failed: {e}")
+			results.extend(NametagResult(att_id, filepath, f"{type(e).__name__}: {e}") for att_id, data, filepath in shard[0])
+
+		if max_workers == 1:
+			for shard in shards:
+				if cancelled is not None and cancelled():
+					break
+				try:
+					# Dans le processus courant, les mesures vont directement dans metrics.
+					results.extend(getattr(self, method_name)(*shard))
+				except Exception as e:
+					add_failed_shard(shard, e)
+				if progress is not None:
+					progress(len(results), total)
+			return results
+
+		with ProcessPoolExecutor(
+			max_workers,
+			initializer=_init_worker,
+			initargs=(type(self), self.engine, self.qr_cache, self.doc.template_file, self.basic_context)
+		) as executor:
+			futures = {executor.submit(_run_shard, method_name, *shard): shard for shard in shards}
+			for future in as_completed(futures):
+				if future.cancelled():
+					continue
+				try:
+					shard_results, shard_metrics = future.result()
+					results.extend(shard_results)
+					metrics.merge(shard_metrics)
+				except Exception as e:
+					# Le processus lui-même a planté : tout le fragment est en erreur.
+					add_failed_shard(futures[future], e)
+				if progress is not None:
+					progress(len(results), total)
+				if cancelled is not None and cancelled():
+					executor.shutdown(wait=False, cancel_futures=True)
+		if cancelled is not None and cancelled():
+			logging.info(f"Nametag generation cancelled after {len(results)}/{total} nametags")
+		return results
+
+	def generate_nametags(self, jobs, render_steps=[], max_workers=None, progress=None, cancelled=None, skip_unchanged=True):
+		jobs = list(jobs)
+		skipped = []
+		if skip_unchanged:
+			jobs, skipped, manifests, hashes = self.skip_unchanged(jobs, render_steps)
+		if max_workers is None:
+			max_workers = os.cpu_count() or 1
+		max_workers = clamp(max_workers, 1, max(len(jobs), 1))
+		# Quelques fragments par processus pour équilibrer la charge sans multiplier les allers-retours.
+		shard_size = clamp(math.ceil(len(jobs) / (max_workers * 4)), 1, 50)
+		shards = [(jobs[i:i + shard_size], render_steps) for i in range(0, len(jobs), shard_size)]
+		results = self.run_shards("generate_batch", shards, len(jobs), max_workers, progress, cancelled)
+		logging.info(f"Generated {sum(r.error is None for r in results)}/{len(jobs)} nametags with {max_workers} processes")
+		if skip_unchanged:
+			self.update_manifests(manifests, hashes, results)
+		# Les cocardes inchangées comptent comme générées : leur document est à jour dans le dossier de sortie.
+		return skipped + results
+
+	def skip_unchanged(self, jobs, render_steps=[]):
+		# Sépare les jobs dont le document existe déjà avec la même empreinte (dans le manifeste de leur dossier).
+		# Une cocarde identique sous un autre nom est copiée plutôt que rendue.
+		manifests = {}
+		hashes = {}
+		to_render = []
+		skipped = []
+		copied = 0
+		with metrics.stage("manifest.check"):
+			for att_id, data, filepath in jobs:
+				directory, filename = os.path.split(filepath)
+				manifest = manifests.get(directory)
+				if manifest is None:
+					manifest = manifests[directory] = OutputManifest(directory, self.template_hash)
+				try:
+					nametag_hash = hashes[filepath] = self.nametag_hash(data, render_steps)
+					existing = manifest.find(filename, nametag_hash)
+					if existing is not None and os.path.abspath(existing) != os.path.abspath(filepath):
+						shutil.copyfile(existing, filepath)
+						copied += 1
+				except Exception as e:
+					# Le rendu donnera l'erreur de cette cocarde dans son NametagResult, sans arrêter le lot.
+					logging.debug(f"Could not check nametag {filepath} against the manifest: {e}")
+					hashes.pop(filepath, None)
+					existing = None
+				if existing is None:
+					to_render.append((att_id, data, filepath))
+					continue
+				manifest.record(filename, att_id, nametag_hash)
+				skipped.append(NametagResult(att_id, filepath, None))
+		if skipped:
+			logging.info(f"Skipped {len(skipped)} unchanged nametags ({copied} copied from identical ones)")
+		return to_render, skipped, manifests, hashes
+
+	@staticmethod
+	def update_manifests(manifests, hashes, results):
+		for r in results:
+			directory, filename = os.path.split(r.filepath)
+			if r.error is None and r.filepath in hashes:
+				manifests[directory].record(filename, r.attendee_id, hashes[r.filepath])
+			else:
+				manifests[directory].forget(filename)
+		for manifest in manifests.values():
+			manifest.save()
+
+	def generate_merged_nametags(self, jobs, filepath_pattern, batch_size=100, render_steps=[], max_workers=None, progress=None, cancelled=None, index_filepath=None):
+		# filepath_pattern reçoit le numéro du lot, par exemple "output/cocardes_{:03d}.docx".
+		jobs = list(jobs)
+		batch_size = max(batch_size, 1)
+		shards = [
+			(jobs[i:i + batch_size], filepath_pattern.format(n + 1), render_steps)
+			for n, i in enumerate(range(0, len(jobs), batch_size))
+		]
+		if max_workers is None:
+			max_workers = os.cpu_count() or 1
+		max_workers = clamp(max_workers, 1, max(len(shards), 1))
+		results = self.run_shards("generate_merged_batch", shards, len(jobs), max_workers, progress, cancelled)
+		logging.info(f"Generated {sum(r.error is None for r in results)}/{len(jobs)} nametags in {len(shards)} merged documents")
+		if index_filepath is not None:
+			self.write_merged_index(results, index_filepath)
+		return results
+
+	@staticmethod
+	def write_merged_index(results, index_filepath):
+		# Chaque cocarde commence une nouvelle section, donc la page est son rang dans le document si le gabarit tient sur une page.
+		rows = sorted((r for r in results if r.error is None), key=lambda r: (r.filepath, r.page))
+		with open(index_filepath, "w", newline="", encoding="utf-8") as file:
+			writer = csv.writer(file)
+			writer.writerow(["attendee_id", "document", "page"])
+			for r in rows:
+				writer.writerow([r.attendee_id, os.path.basename(r.filepath), r.page])
+		logging.info(f"Wrote nametags index {index_filepath}")
+
+	def generate_qrcode(self, data):
+		# Le PNG vient de la cache si ce code a déjà été encodé avec les mêmes paramètres.
+		return self.qr_cache.get(data)
 
 	@render_step
 	def add_qr_code(self, data, filepath):
-		img_filepath = os.path.splitext(filepath)[0] + "_QR.png"
-		self.generate_qrcode(data["barcode"], img_filepath)
 		# replace_pic fonctionne de façon un peu particulière, il faut utiliser le champ 'name' dans le document.xml à l'intérieur du docx.
-		self.doc.replace_pic("Picture 4", img_filepath)
+		self.doc.replace_pic("Picture 4", io.BytesIO(self.generate_qrcode(data["barcode"])))
 
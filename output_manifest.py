@@ -0,0 +1,71 @@
+import os
+import json
+import hashlib
+import logging
+
+
+MANIFEST_NAME = ".nametags_manifest.json"
+
+
+def file_hash(filepath):
+	digest = hashlib.sha256()
+	with open(filepath, "rb") as file:
+		for chunk in iter(lambda: file.read(1 << 16), b""):
+			digest.update(chunk)
+	return digest.hexdigest()
+
+
+class OutputManifest:
+	# Empreinte de ce qui a servi à rendre chaque cocarde d'un dossier de sortie (valeurs du gabarit, étapes, gabarit),
+	# pour ne pas refaire une cocarde qui donnerait le même document. Un autre gabarit invalide tout le manifeste.
+	def __init__(self, directory, template_hash):
+		self.filepath = os.path.join(directory, MANIFEST_NAME)
+		self.directory = directory
+		self.template_hash = template_hash
+		# Nom de fichier -> {"attendee_id", "hash"}, et empreinte -> noms de fichiers, pour copier une cocarde identique.
+		self.entries = {}
+		self.by_hash = {}
+		self.load()
+
+	def load(self):
+		try:
+			with open(self.filepath, encoding="utf-8") as file:
+				data = json.load(file)
+		except FileNotFoundError:
+			return
+		except ValueError as e:
+			logging.warning(f"Ignoring unreadable nametags manifest {self.filepath}: {e}")
+			return
+		if data.get("template") != self.template_hash:
+			logging.info(f"Nametag template changed, all nametags in {self.directory} will be generated again")
+			return
+		for filename, entry in data.get("entries", {}).items():
+			self.record(filename, entry["attendee_id"], entry["hash"])
+
+	def save(self):
+		tmp_path = f"{self.filepath}.{os.getpid()}.tmp"
+		with open(tmp_path, "w", encoding="utf-8") as file:
+			json.dump({"template": self.template_hash, "entries": self.entries}, file, ensure_ascii=False)
+		os.replace(tmp_path, self.filepath)
+
+	def find(self, filename, nametag_hash):
+		# Un fichier existant rendu avec cette empreinte, le fichier demandé de préférence. None s'il faut la générer.
+		filenames = self.by_hash.get(nametag_hash, ())
+		for candidate in sorted(filenames, key=lambda name: name != filename):
+			path = os.path.join(self.directory, candidate)
+			if os.path.exists(path):
+				return path
+		return None
+
+	def record(self, filename, attendee_id, nametag_hash):
+		self.forget(filename)
+		self.entries[filename] = {"attendee_id": attendee_id, "hash": nametag_hash}
+		self.by_hash.setdefault(nametag_hash, set()).add(filename)
+
+	def forget(self, filename):
+		entry = self.entries.pop(filename, None)
+		if entry is not None:
+			filenames = self.by_hash[entry["hash"]]
+			filenames.discard(filename)
+			if not filenames:
+				del self.by_hash[entry["hash"]]
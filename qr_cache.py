@@ -0,0 +1,119 @@
+import io
+import os
+import logging
+import hashlib
+import threading
+from collections import OrderedDict
+
+from instrumentation import metrics
+
+
+class QRCodeCache:
+	def __init__(self, max_entries=10000, disk_dir=None, **qr_params):
+		# qr_params est passé tel quel à qrcode.make (box_size, border, error_correction, etc.)
+		self.max_entries = max_entries
+		self.disk_dir = disk_dir
+		self.qr_params = qr_params
+		self.entries = OrderedDict()
+		self.lock = threading.Lock()
+		self.prefetch_generation = 0
+
+	# Le verrou et le fil de préchargement ne se transfèrent pas aux processus de génération, mais le contenu oui.
+	def __getstate__(self):
+		with self.lock:
+			return {
+				"max_entries": self.max_entries,
+				"disk_dir": self.disk_dir,
+				"qr_params": self.qr_params,
+				"entries": OrderedDict(self.entries),
+			}
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self.lock = threading.Lock()
+		self.prefetch_generation = 0
+
+	def make_key(self, data):
+		return (data, tuple(sorted(self.qr_params.items())))
+
+	def disk_path(self, key):
+		digest = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+		return os.path.join(self.disk_dir, digest[:2], digest + ".png")
+
+	def encode(self, data):
+		# Importé au premier encodage seulement, pour ne pas ralentir le démarrage.
+		import qrcode
+		with metrics.stage("qr.encode") as timing:
+			img = qrcode.make(data, **self.qr_params)
+			buffer = io.BytesIO()
+			img.save(buffer)
+			timing.bytes = buffer.tell()
+		return buffer.getvalue()
+
+	def get(self, data):
+		key = self.make_key(data)
+		with self.lock:
+			png_data = self.entries.get(key)
+			if png_data is not None:
+				self.entries.move_to_end(key)
+				return png_data
+
+		png_data = self.load_from_disk(key)
+		if png_data is None:
+			png_data = self.encode(data)
+			self.save_to_disk(key, png_data)
+
+		with self.lock:
+			self.entries[key] = png_data
+			self.entries.move_to_end(key)
+			while len(self.entries) > self.max_entries:
+				self.entries.popitem(last=False)
+		return png_data
+
+	def load_from_disk(self, key):
+		if self.disk_dir is None:
+			return None
+		try:
+			file = open(self.disk_path(key), "rb")
+		except FileNotFoundError:
+			return None
+		# Seules les lectures réussies sont comptées, un code absent du disque n'est pas un chargement.
+		with file, metrics.stage("qr.disk_load") as timing:
+			png_data = file.read()
+			timing.bytes = len(png_data)
+		return png_data
+
+	def save_to_disk(self, key, png_data):
+		if self.disk_dir is None:
+			return
+		path = self.disk_path(key)
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		# Écrire dans un fichier temporaire puis renommer, pour qu'un autre processus ne lise jamais un fichier partiel.
+		tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+		with open(tmp_path, "wb") as file:
+			file.write(png_data)
+		os.replace(tmp_path, path)
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+
+	def prefetch(self, barcodes):
+		# Encoder d'avance en arrière-plan. Un nouvel appel annule le préchargement précédent.
+		barcodes = list(barcodes)
+		self.prefetch_generation += 1
+		generation = self.prefetch_generation
+
+		def run():
+			for barcode in barcodes:
+				if generation != self.prefetch_generation:
+					return
+				try:
+					self.get(barcode)
+				except Exception as e:
+					logging.warning(f"Could not pre-encode QR code {barcode}: {e}")
+			logging.debug(f"Pre-encoded {len(barcodes)} QR codes")
+
+		thread = threading.Thread(target=run, name="qr-prefetch", daemon=True)
+		thread.start()
+		return thread
@@ -0,0 +1,33 @@
+# Les utilitaires qui dépendent de Qt sont séparés de utils.py, pour que le mode en ligne de commande n'importe pas Qt.
+from PySide6.QtCore import Qt
+
+
+def checkToBool(checkState):
+	return False if checkState == Qt.Unchecked else True
+
+def boolToCheck(boolean):
+	return Qt.Checked if boolean else Qt.Unchecked
+
+def choose_items(parent, title, label, items, checked=()):
+	# Comme QInputDialog.getItem, mais avec plusieurs choix. items : (texte, donnée). Retourne les données cochées, ou None si annulé.
+	from PySide6.QtWidgets import QDialog, QVBoxLayout, QLabel, QListWidget, QListWidgetItem, QDialogButtonBox
+	dialog = QDialog(parent)
+	dialog.setWindowTitle(title)
+	layout = QVBoxLayout(dialog)
+	layout.addWidget(QLabel(label))
+	list_widget = QListWidget()
+	for text, data in items:
+		item = QListWidgetItem(text, list_widget)
+		item.setData(Qt.UserRole, data)
+		item.setCheckState(boolToCheck(data in checked))
+	layout.addWidget(list_widget)
+	buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+	buttons.accepted.connect(dialog.accept)
+	buttons.rejected.connect(dialog.reject)
+	layout.addWidget(buttons)
+	if not dialog.exec():
+		return None
+	return [
+		list_widget.item(i).data(Qt.UserRole) for i in range(list_widget.count())
+		if checkToBool(list_widget.item(i).checkState())
+	]
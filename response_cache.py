@@ -0,0 +1,79 @@
+import os
+import json
+import time
+import logging
+import threading
+
+
+# Durée de validité par type de réponse (s). Les organisations ne changent presque jamais, un événement un peu plus souvent.
+DEFAULT_TTLS = {
+	"organizations": 24 * 3600,
+	"events": 3600,
+	"event": 600,
+}
+
+
+class ResponseCache:
+	# Réponses d'Eventbrite gardées par clé, avec leur moment de réception. Avec un filepath, la cache est
+	# rechargée au démarrage et réécrite à chaque ajout (quelques organisations et listes d'événements, donc petite).
+	def __init__(self, filepath=None, ttls=None):
+		self.filepath = filepath
+		self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+		self.lock = threading.Lock()
+		# Une sauvegarde à la fois, de la copie des entrées jusqu'au remplacement du fichier : sinon un fil avec une copie
+		# plus ancienne pourrait remplacer le fichier après un autre et perdre des entrées (préchargement en parallèle).
+		self.save_lock = threading.Lock()
+		self.entries = {}
+		if filepath is not None:
+			self.load()
+
+	def load(self):
+		try:
+			with open(self.filepath, encoding="utf-8") as file:
+				self.entries = json.load(file)
+		except FileNotFoundError:
+			return
+		except ValueError as e:
+			logging.warning(f"Ignoring unreadable response cache {self.filepath}: {e}")
+			return
+		logging.debug(f"Loaded {len(self.entries)} cached Eventbrite responses from {self.filepath}")
+
+	def save(self):
+		if self.filepath is None:
+			return
+		os.makedirs(os.path.dirname(self.filepath) or ".", exist_ok=True)
+		tmp_path = f"{self.filepath}.{os.getpid()}.tmp"
+		with self.save_lock:
+			with self.lock:
+				data = json.dumps(self.entries, ensure_ascii=False)
+			with open(tmp_path, "w", encoding="utf-8") as file:
+				file.write(data)
+			os.replace(tmp_path, self.filepath)
+
+	def make_key(self, kind, *parts):
+		return ":".join([kind, *map(str, parts)])
+
+	def get(self, kind, *parts):
+		# Retourne None si absent ou expiré.
+		with self.lock:
+			entry = self.entries.get(self.make_key(kind, *parts))
+		if entry is None or time.time() - entry["ts"] > self.ttls.get(kind, 0):
+			return None
+		return entry["data"]
+
+	def put(self, kind, *parts, data):
+		with self.lock:
+			self.entries[self.make_key(kind, *parts)] = {"ts": time.time(), "data": data}
+		self.save()
+		return data
+
+	def invalidate(self, kind=None, *parts):
+		# Sans argument, tout est oublié. Avec seulement kind, toutes les réponses de ce type.
+		with self.lock:
+			if kind is None:
+				self.entries.clear()
+			else:
+				prefix = self.make_key(kind, *parts)
+				for key in [k for k in self.entries if k == prefix or k.startswith(prefix + ":")]:
+					del self.entries[key]
+		self.save()
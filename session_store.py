@@ -0,0 +1,162 @@
+import json
+import time
+import sqlite3
+import logging
+
+from instrumentation import metrics
+
+
+# Partagé entre l'interface et le mode en ligne de commande.
+DEFAULT_SESSION_PATH = "sessions/session.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta_journal (
+	seq INTEGER PRIMARY KEY AUTOINCREMENT,
+	ts REAL NOT NULL,
+	key TEXT NOT NULL,
+	value TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS meta_journal_key ON meta_journal (key, seq);
+CREATE TABLE IF NOT EXISTS attendee_journal (
+	seq INTEGER PRIMARY KEY AUTOINCREMENT,
+	ts REAL NOT NULL,
+	event_id TEXT NOT NULL,
+	attendee_id TEXT NOT NULL,
+	data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS attendee_journal_id ON attendee_journal (event_id, attendee_id, seq);
+CREATE INDEX IF NOT EXISTS attendee_journal_ts ON attendee_journal (ts);
+CREATE TABLE IF NOT EXISTS payloads (
+	event_id TEXT NOT NULL,
+	attendee_id TEXT NOT NULL,
+	payload BLOB NOT NULL,
+	PRIMARY KEY (event_id, attendee_id)
+);
+CREATE TABLE IF NOT EXISTS restores (
+	seq INTEGER PRIMARY KEY AUTOINCREMENT,
+	ts REAL NOT NULL,
+	restored_at REAL NOT NULL
+);
+"""
+
+
+class SessionStore:
+	# Journal en ajout seulement : chaque sauvegarde n'écrit que les participants modifiés et les réglages qui ont changé.
+	# L'état à un moment donné est la dernière entrée de chaque clé et de chaque participant à ce moment.
+	def __init__(self, filepath):
+		self.filepath = filepath
+		self.db = sqlite3.connect(filepath)
+		self.db.execute("PRAGMA journal_mode=WAL")
+		# En WAL, NORMAL ne perd au pire que la dernière transaction lors d'une panne de courant, jamais la base.
+		self.db.execute("PRAGMA synchronous=NORMAL")
+		self.db.executescript(SCHEMA)
+		self.last_meta = self.load_meta()
+
+	def close(self):
+		self.db.close()
+
+	def save(self, meta, event_id, attendees, dirty_ids=(), dirty_payload_ids=()):
+		# Les valeurs de meta doivent être sérialisables en JSON. Retourne le nombre de participants écrits.
+		# Chaque participant est journalisé sous son propre événement, event_id sert pour ceux qui n'en ont pas.
+		ts = time.time()
+		with metrics.stage("session.save"), self.db:
+			for key, value in meta.items():
+				encoded = json.dumps(value, ensure_ascii=False, sort_keys=True)
+				if self.last_meta.get(key) != encoded:
+					self.db.execute("INSERT INTO meta_journal (ts, key, value) VALUES (?, ?, ?)", (ts, key, encoded))
+					self.last_meta[key] = encoded
+			if event_id is None:
+				return 0
+			rows = [
+				(ts, attendees[att_id].event_id or event_id, att_id, json.dumps(attendees[att_id].serialize(include_payload=False), ensure_ascii=False))
+				for att_id in dirty_ids if att_id in attendees
+			]
+			self.db.executemany("INSERT INTO attendee_journal (ts, event_id, attendee_id, data) VALUES (?, ?, ?, ?)", rows)
+			# Le JSON d'Eventbrite n'est pas historisé, seule sa dernière version est gardée.
+			self.db.executemany(
+				"INSERT OR REPLACE INTO payloads (event_id, attendee_id, payload) VALUES (?, ?, ?)",
+				[(attendees[att_id].event_id or event_id, att_id, attendees[att_id].raw_payload) for att_id in dirty_payload_ids if att_id in attendees]
+			)
+		if rows:
+			logging.debug(f"Saved {len(rows)} attendees to session {self.filepath}")
+		return len(rows)
+
+	def visible_ranges(self, at):
+		# Intervalles (début, fin] du journal qui forment l'état à 'at'. Après une restauration, l'état est celui du moment
+		# restauré suivi de ce qui a été journalisé depuis : ce qui avait été écrit entre les deux est ignoré.
+		ranges = []
+		while True:
+			restore = self.db.execute(
+				"SELECT ts, restored_at FROM restores WHERE ts <= ? ORDER BY seq DESC LIMIT 1", (at,)
+			).fetchone()
+			if restore is None:
+				ranges.append((float("-inf"), at))
+				return ranges
+			ranges.append((restore[0], at))
+			at = restore[1]
+
+	def visible_condition(self, at):
+		ranges = self.visible_ranges(at)
+		return " OR ".join(["(ts > ? AND ts <= ?)"] * len(ranges)), [bound for r in ranges for bound in r]
+
+	def restore(self, at):
+		# La session telle qu'elle était à 'at' devient la plus récente, sans réécrire le journal.
+		with self.db:
+			self.db.execute("INSERT INTO restores (ts, restored_at) VALUES (?, ?)", (time.time(), at))
+		self.last_meta = self.load_meta()
+		logging.info(f"Restored session {self.filepath} as of {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(at))}")
+
+	def load_meta(self, at=None):
+		at = time.time() if at is None else at
+		condition, params = self.visible_condition(at)
+		cursor = self.db.execute(
+			f"SELECT key, value FROM meta_journal WHERE seq IN (SELECT MAX(seq) FROM meta_journal WHERE {condition} GROUP BY key)",
+			params
+		)
+		return dict(cursor.fetchall())
+
+	def load(self, at=None):
+		# Retourne les données de session dans le même format que l'ancien quicksave JSON, ou None si rien n'a été sauvegardé.
+		at = time.time() if at is None else at
+		meta = {key: json.loads(value) for key, value in self.load_meta(at).items()}
+		if not meta:
+			return None
+		event = meta.get("event")
+		# Tous les événements chargés en mode multi-événements, seulement event dans les sessions plus anciennes.
+		event_ids = [e["id"] for e in meta.get("events") or ([event] if event is not None else [])]
+		attendees = {}
+		if event_ids:
+			condition, params = self.visible_condition(at)
+			cursor = self.db.execute(
+				f"""
+				SELECT j.attendee_id, j.data, p.payload FROM attendee_journal j
+				LEFT JOIN payloads p ON p.event_id = j.event_id AND p.attendee_id = j.attendee_id
+				WHERE j.seq IN (
+					SELECT MAX(seq) FROM attendee_journal WHERE event_id IN ({", ".join("?" * len(event_ids))}) AND ({condition}) GROUP BY event_id, attendee_id
+				)
+				ORDER BY j.seq
+				""",
+				(*event_ids, *params)
+			)
+			for att_id, data, payload in cursor:
+				attendees[att_id] = json.loads(data)
+				attendees[att_id]["raw_payload"] = payload or b""
+		meta["attendees"] = attendees
+		return meta
+
+	def revisions(self, limit=100):
+		# Les moments où quelque chose a été sauvegardé ou restauré, du plus récent au plus ancien, avec le nombre de
+		# participants écrits.
+		cursor = self.db.execute(
+			"""
+			SELECT ts, SUM(n) FROM (
+				SELECT ts, 0 AS n FROM meta_journal
+				UNION ALL
+				SELECT ts, COUNT(*) AS n FROM attendee_journal GROUP BY ts
+				UNION ALL
+				SELECT ts, 0 AS n FROM restores
+			) GROUP BY ts ORDER BY ts DESC LIMIT ?
+			""",
+			(limit,)
+		)
+		return cursor.fetchall()
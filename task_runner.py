@@ -0,0 +1,88 @@
+import logging
+
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+
+
+class TaskCancelled(Exception):
+	pass
+
+
+class TaskSignals(QObject):
+	# Les signaux sont émis depuis le fil de travail et livrés dans le fil du GUI (connexion en file d'attente).
+	progress = Signal(int, int)
+	finished = Signal(object)
+	failed = Signal(str)
+	cancelled = Signal()
+	done = Signal()
+
+
+class Task(QRunnable):
+	def __init__(self, func, *args, **kwargs):
+		super().__init__()
+		self.setAutoDelete(False)
+		self.func = func
+		self.args = args
+		self.kwargs = kwargs
+		self.signals = TaskSignals()
+		self.is_cancelled = False
+
+	def cancel(self):
+		self.is_cancelled = True
+
+	def check_cancelled(self):
+		if self.is_cancelled:
+			raise TaskCancelled()
+
+	# Utilisable directement comme fonction de progression par EventbriteManager et NametagGenerator.
+	def report_progress(self, done, total):
+		self.check_cancelled()
+		self.signals.progress.emit(done, total)
+
+	def run(self):
+		try:
+			# La fonction reçoit la tâche en premier argument pour rapporter sa progression et vérifier l'annulation.
+			result = self.func(self, *self.args, **self.kwargs)
+		except TaskCancelled:
+			logging.info(f"Task {self.func.__name__} cancelled")
+			self.signals.cancelled.emit()
+		except Exception as e:
+			logging.exception(f"Task {self.func.__name__} failed")
+			self.signals.failed.emit(f"{type(e).__name__}: {e}")
+		else:
+			self.signals.finished.emit(result)
+		self.signals.done.emit()
+
+
+class TaskRunner(QObject):
+	def __init__(self, max_threads=4, parent=None):
+		super().__init__(parent)
+		self.pool = QThreadPool(self)
+		self.pool.setMaxThreadCount(max_threads)
+		# Garder une référence Python aux tâches actives, sinon elles pourraient être ramassées en cours d'exécution.
+		self.tasks = set()
+
+	def start(self, func, *args, on_finished=None, on_failed=None, on_progress=None, on_cancelled=None, on_done=None, **kwargs):
+		# Tout est connecté avant le démarrage : une tâche rapide pourrait sinon émettre ses signaux avant qu'on les écoute.
+		task = Task(func, *args, **kwargs)
+		if on_finished is not None:
+			task.signals.finished.connect(on_finished)
+		if on_failed is not None:
+			task.signals.failed.connect(on_failed)
+		if on_progress is not None:
+			task.signals.progress.connect(on_progress)
+		if on_cancelled is not None:
+			task.signals.cancelled.connect(on_cancelled)
+		if on_done is not None:
+			# on_done reçoit la tâche, qui n'existe pas encore quand l'appelant prépare ses fonctions.
+			task.signals.done.connect(lambda: on_done(task))
+		task.signals.done.connect(lambda: self.tasks.discard(task))
+		self.tasks.add(task)
+		self.pool.start(task)
+		return task
+
+	def cancel_all(self):
+		for task in list(self.tasks):
+			task.cancel()
+
+	def wait(self, msecs=-1):
+		return self.pool.waitForDone(msecs)
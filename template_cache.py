@@ -0,0 +1,383 @@
+import os
+import re
+import copy
+import struct
+import zipfile
+import posixpath
+from collections import namedtuple
+
+from lxml import etree
+import docx.oxml.ns
+from docx.opc.constants import RELATIONSHIP_TYPE as REL_TYPE
+from jinja2 import Environment
+from markupsafe import escape
+
+from instrumentation import metrics
+
+
+NSMAP = docx.oxml.ns.nsmap
+PKG_RELS_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+BODY_MARKER = "docxtpl-body"
+# Une variable simple, sans filtre ni expression : {{ nom }}
+SIMPLE_TAG = re.compile(r"\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}")
+LISTING_CHARS = "\t\a\f\n"
+LISTING_TEXT = re.compile(r"<w:t(?: [^>]*)?>[^<]*[\t\a\f\n]")
+
+# Une partie XML du document qui contient des balises Jinja. Le préfixe et le suffixe entourent le corps du document principal.
+CompiledPart = namedtuple("CompiledPart", """
+	template
+	prefix
+	suffix
+""")
+
+
+def has_template_tags(xml):
+	return "{{" in xml or "{%" in xml or "{#" in xml
+
+def unescape_braces(xml):
+	return xml.replace("{_{", "{{").replace("}_}", "}}").replace("{_%", "{%").replace("%_}", "%}")
+
+def read_raw_member(zin, info):
+	# Lire les données compressées d'un membre telles quelles, en sautant son en-tête local.
+	zin.fp.seek(info.header_offset)
+	header = zin.fp.read(zipfile.sizeFileHeader)
+	name_len, extra_len = struct.unpack("<HH", header[26:30])
+	zin.fp.seek(info.header_offset + zipfile.sizeFileHeader + name_len + extra_len)
+	return zin.fp.read(info.compress_size)
+
+def write_raw_member(zout, info, raw):
+	# Copier un membre déjà compressé octet pour octet, sans le recompresser.
+	info = copy.copy(info)
+	info.flag_bits &= ~0x08
+	info.header_offset = zout.fp.tell()
+	zout.fp.write(info.FileHeader())
+	zout.fp.write(raw)
+	zout.start_dir = zout.fp.tell()
+	zout.filelist.append(info)
+	zout.NameToInfo[info.filename] = info
+	zout._didModify = True
+
+def rels_path(partname):
+	return posixpath.join(posixpath.dirname(partname), "_rels", posixpath.basename(partname) + ".rels")
+
+def read_rels(members, partname):
+	# Retourne {rId: (type, chemin dans le zip)} pour les relations internes d'une partie.
+	data = members.get(rels_path(partname))
+	if data is None:
+		return {}
+	rels = {}
+	for rel in etree.fromstring(data).iter(f"{{{PKG_RELS_NS}}}Relationship"):
+		if rel.get("TargetMode") == "External":
+			continue
+		target = rel.get("Target")
+		if target.startswith("/"):
+			target = target[1:]
+		else:
+			target = posixpath.normpath(posixpath.join(posixpath.dirname(partname), target))
+		rels[rel.get("Id")] = (rel.get("Type"), target)
+	return rels
+
+
+class CompiledTemplate:
+	def __init__(self, doc):
+		# Le DocxTemplate d'origine sert aux fonctions de nettoyage XML de docxtpl et aux remplacements d'images.
+		self.doc = doc
+		self.env = Environment(autoescape=True)
+		with zipfile.ZipFile(doc.template_file) as zin:
+			self.infos = zin.infolist()
+			self.members = {info.filename: zin.read(info.filename) for info in self.infos}
+			self.raw_members = {info.filename: read_raw_member(zin, info) for info in self.infos}
+
+		self.main_part = next(
+			target for rel_type, target in read_rels(self.members, "").values()
+			if rel_type == REL_TYPE.OFFICE_DOCUMENT
+		)
+		self.main_rels = main_rels = read_rels(self.members, self.main_part)
+		self.parts = {}
+		# Pour le rendu rapide : alternance de texte littéral et de noms de variables, par partie.
+		self.simple_parts = {}
+		self.is_simple = True
+		self.compile_main_part()
+		for rel_type, target in main_rels.values():
+			if rel_type in (REL_TYPE.HEADER, REL_TYPE.FOOTER, REL_TYPE.FOOTNOTES):
+				self.compile_part(target)
+		if "docProps/core.xml" in self.members:
+			self.compile_part("docProps/core.xml", patch=False)
+
+		# Images nommées de chaque partie, pour faire l'équivalent de replace_pic directement dans le zip.
+		self.pictures = {}
+		self.main_picture_rels = {}
+		for partname in [self.main_part] + [t for r, t in main_rels.values() if r in (REL_TYPE.HEADER, REL_TYPE.FOOTER)]:
+			self.index_pictures(partname)
+
+	def compile_main_part(self):
+		root = etree.fromstring(self.members[self.main_part])
+		body = root.find("w:body", NSMAP)
+		body_xml = etree.tostring(body, encoding="unicode")
+		# Garder le reste du document tel quel de part et d'autre du corps.
+		body.addprevious(etree.Comment(BODY_MARKER))
+		root.remove(body)
+		prefix, suffix = etree.tostring(root, encoding="unicode").split(f"<!--{BODY_MARKER}-->")
+		self.main_prefix = XML_DECLARATION + prefix
+		self.main_suffix = suffix
+		if not has_template_tags(body_xml):
+			return
+		self.parts[self.main_part] = CompiledPart(self.compile_xml(body_xml), self.main_prefix, self.main_suffix)
+		self.compile_simple(self.main_part)
+
+	def compile_part(self, partname, patch=True):
+		xml = etree.tostring(etree.fromstring(self.members[partname]), encoding="unicode")
+		if not has_template_tags(xml):
+			return
+		self.parts[partname] = CompiledPart(self.compile_xml(xml, patch), XML_DECLARATION, "")
+		self.compile_simple(partname, patch)
+
+	def compile_xml(self, xml, patch=True):
+		if patch:
+			xml = self.doc.patch_xml(xml)
+		# Même préparation que DocxTemplate.render_xml_part, mais faite une seule fois.
+		xml = re.sub(r"<w:p([ >])", r"\n<w:p\1", xml)
+		return self.env.from_string(xml)
+
+	def compile_simple(self, partname, patch=True):
+		# Le rendu rapide travaille sur le XML d'origine complet, donc tout ce qui n'est pas une variable est copié tel quel.
+		xml = self.members[partname].decode("utf-8")
+		if patch:
+			xml = self.doc.patch_xml(xml)
+		chunks = SIMPLE_TAG.split(xml)
+		literals = chunks[0::2]
+		# Une boucle, une condition, un commentaire ou une expression plus complexe demande Jinja.
+		if any(has_template_tags(literal) or LISTING_TEXT.search(literal) for literal in literals):
+			self.is_simple = False
+			return
+		chunks[0::2] = [unescape_braces(literal) for literal in literals]
+		self.simple_parts[partname] = chunks
+
+	def index_pictures(self, partname):
+		rels = read_rels(self.members, partname)
+		root = etree.fromstring(self.members[partname])
+		for gd in root.iterfind(".//a:graphic/a:graphicData", NSMAP):
+			if gd.get("uri") != NSMAP["pic"]:
+				continue
+			embed = gd.xpath("pic:pic/pic:blipFill/a:blip/@r:embed", namespaces=NSMAP)
+			props = gd.find("pic:pic/pic:nvPicPr/pic:cNvPr", NSMAP)
+			if not embed or props is None or embed[0] not in rels:
+				continue
+			target = rels[embed[0]][1]
+			for key in (props.get("name"), props.get("title"), props.get("descr")):
+				if key:
+					self.pictures.setdefault(key, set()).add(target)
+					if partname == self.main_part:
+						self.main_picture_rels.setdefault(key, set()).add(embed[0])
+
+	def render_part(self, partname, context):
+		part = self.parts[partname]
+		xml = part.template.render(context)
+		xml = re.sub(r"\n<w:p([ >])", r"<w:p\1", xml)
+		xml = unescape_braces(xml)
+		# resolve_listing ne change rien s'il n'y a aucun caractère spécial dans le texte.
+		if any(c in xml for c in LISTING_CHARS):
+			xml = self.doc.resolve_listing(xml)
+		if partname == self.main_part:
+			tree = self.doc.fix_tables(xml)
+			for i, elt in enumerate(tree.iterfind(".//wp:docPr", NSMAP)):
+				elt.set("id", str(1001 + i))
+			xml = etree.tostring(tree, encoding="unicode")
+		return (part.prefix + xml + part.suffix).encode("utf-8")
+
+	def render_part_simple(self, partname, context):
+		chunks = list(self.simple_parts[partname])
+		needs_listing = False
+		for i in range(1, len(chunks), 2):
+			# Même résultat que {{ nom }} avec autoescape : une variable absente donne une chaîne vide.
+			value = escape(context[chunks[i]]) if chunks[i] in context else ""
+			needs_listing = needs_listing or any(c in value for c in LISTING_CHARS)
+			chunks[i] = value
+		xml = "".join(chunks)
+		if needs_listing:
+			xml = self.doc.resolve_listing(xml)
+		return xml.encode("utf-8")
+
+	def render_main(self, context, simple=False):
+		if self.main_part not in self.parts:
+			return self.members[self.main_part]
+		if simple:
+			return self.render_part_simple(self.main_part, context)
+		return self.render_part(self.main_part, context)
+
+	def replaced_members(self, include_pics=True):
+		# Traduire les remplacements demandés au DocxTemplate (replace_pic, replace_media, etc.) en membres du zip.
+		doc = self.doc
+		replaced = dict(doc.zipname_to_replace)
+		for name, data in (doc.pics_to_replace.items() if include_pics else []):
+			targets = self.pictures.get(name)
+			if not targets:
+				if doc.allow_missing_pics:
+					continue
+				raise ValueError(f"Picture {name} not found in the docx template")
+			for target in targets:
+				replaced[target] = data
+		if doc.crc_to_new_media or doc.crc_to_new_embedded:
+			for info in self.infos:
+				if info.filename.startswith("word/media/") and info.CRC in doc.crc_to_new_media:
+					replaced[info.filename] = doc.crc_to_new_media[info.CRC]
+				elif info.filename.startswith("word/embeddings/") and info.CRC in doc.crc_to_new_embedded:
+					replaced[info.filename] = doc.crc_to_new_embedded[info.CRC]
+		return replaced
+
+	def render(self, context, filepath, simple=False):
+		if simple and not self.is_simple:
+			raise ValueError("Template uses Jinja features that the simple renderer does not support")
+		with metrics.stage("render"):
+			replaced = self.replaced_members()
+			for partname in self.parts:
+				if simple:
+					replaced[partname] = self.render_part_simple(partname, context)
+				else:
+					replaced[partname] = self.render_part(partname, context)
+		with metrics.stage("write") as timing:
+			with zipfile.ZipFile(filepath, "w") as zout:
+				for info in self.infos:
+					if info.filename in replaced:
+						zout.writestr(info, replaced[info.filename])
+					else:
+						write_raw_member(zout, info, self.raw_members[info.filename])
+			timing.bytes = os.path.getsize(filepath)
+
+
+# Écrit plusieurs cocardes à la suite dans un seul .docx, une section (donc une nouvelle page) par cocarde.
+# Le document.xml est écrit en continu dans le zip au fur et à mesure des ajouts, donc seule la cocarde
+# courante et les images de remplacement restent en mémoire.
+class MergedDocumentWriter:
+	def __init__(self, compiled, filepath, simple=False):
+		self.compiled = compiled
+		self.filepath = filepath
+		self.simple = simple
+		self.count = 0
+		self.docpr_id = 1000
+		self.media = []
+		self.new_rels = []
+		self.shared_parts = None
+		self.pending = None
+		self.stream = None
+		self.zout = zipfile.ZipFile(filepath, "w")
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		self.close()
+
+	def add(self, context):
+		compiled = self.compiled
+		root = etree.fromstring(compiled.render_main(context, self.simple))
+		body = root.find("w:body", NSMAP)
+		self.count += 1
+
+		# Chaque cocarde a ses propres images : nouveau média et nouvelle relation, puis on redirige les a:blip.
+		for name, data in compiled.doc.pics_to_replace.items():
+			rel_ids = compiled.main_picture_rels.get(name)
+			if not rel_ids:
+				raise ValueError(f"Picture {name} must be in the document body to be used in a merged document")
+			for rel_id in rel_ids:
+				new_rel_id = f"rIdBadge{self.count}_{len(self.new_rels)}"
+				ext = posixpath.splitext(compiled.main_rels[rel_id][1])[1]
+				media_name = f"word/media/badge{self.count}_{len(self.new_rels)}{ext}"
+				self.media.append((media_name, data))
+				self.new_rels.append((new_rel_id, posixpath.relpath(media_name, posixpath.dirname(compiled.main_part))))
+				for blip in body.iterfind(".//a:blip", NSMAP):
+					if blip.get(f"{{{NSMAP['r']}}}embed") == rel_id:
+						blip.set(f"{{{NSMAP['r']}}}embed", new_rel_id)
+		# Les identifiants de dessin doivent être uniques dans tout le document.
+		for elt in body.iterfind(".//wp:docPr", NSMAP):
+			self.docpr_id += 1
+			elt.set("id", str(self.docpr_id))
+
+		if self.shared_parts is None:
+			# En-têtes, pieds de page et remplacements globaux : ceux de la première cocarde du lot.
+			self.shared_parts = compiled.replaced_members(include_pics=False)
+			for partname in compiled.parts:
+				if partname != compiled.main_part:
+					self.shared_parts[partname] = compiled.render_part(partname, context)
+			info = copy.copy(next(i for i in compiled.infos if i.filename == compiled.main_part))
+			self.stream = self.zout.open(info, "w")
+			self.stream.write(compiled.main_prefix.encode("utf-8"))
+			self.stream.write(b"<w:body>")
+
+		self.flush_pending(last=False)
+		self.pending = body
+		return self.count
+
+	def flush_pending(self, last):
+		body = self.pending
+		if body is None:
+			return
+		self.pending = None
+		sect_pr = body[-1] if len(body) and body[-1].tag == f"{{{NSMAP['w']}}}sectPr" else None
+		if sect_pr is not None and not last:
+			# Une section se termine par un sectPr dans les propriétés de son dernier paragraphe.
+			body.remove(sect_pr)
+			last_p = body[-1] if len(body) and body[-1].tag == f"{{{NSMAP['w']}}}p" else etree.SubElement(body, f"{{{NSMAP['w']}}}p")
+			p_pr = last_p.find("w:pPr", NSMAP)
+			if p_pr is None:
+				p_pr = etree.Element(f"{{{NSMAP['w']}}}pPr")
+				last_p.insert(0, p_pr)
+			p_pr.append(sect_pr)
+		xml = etree.tostring(body, encoding="unicode")
+		# Garder seulement le contenu du w:body, le document englobant déclare déjà les espaces de noms.
+		inner = xml[xml.index(">") + 1:xml.rindex("</w:body>")] if not xml.endswith("/>") else ""
+		self.stream.write(inner.encode("utf-8"))
+
+	def close(self):
+		if self.zout is None:
+			return
+		with metrics.stage("merged.write") as timing:
+			self.write_document()
+			timing.bytes = os.path.getsize(self.filepath)
+		self.zout = None
+		if self.count == 0:
+			os.remove(self.filepath)
+
+	def write_document(self):
+		# La fin du document.xml, puis tout ce qui dépend de l'ensemble des cocardes : relations, médias et types de contenu.
+		compiled = self.compiled
+		if self.stream is not None:
+			self.flush_pending(last=True)
+			self.stream.write(b"</w:body>")
+			self.stream.write(compiled.main_suffix.encode("utf-8"))
+			self.stream.close()
+		# Le reste est copié tel quel, sauf les parties rendues avec le contexte de la première cocarde.
+		shared_parts = self.shared_parts or {}
+		deferred = {compiled.main_part, rels_path(compiled.main_part), "[Content_Types].xml"}
+		for info in compiled.infos:
+			if info.filename in deferred:
+				continue
+			if info.filename in shared_parts:
+				self.zout.writestr(info, shared_parts[info.filename])
+			else:
+				write_raw_member(self.zout, info, compiled.raw_members[info.filename])
+		for name, data in self.media:
+			self.zout.writestr(name, data)
+		self.write_rels()
+		self.write_content_types()
+		self.zout.close()
+
+	def write_rels(self):
+		name = rels_path(self.compiled.main_part)
+		root = etree.fromstring(self.compiled.members[name])
+		for rel_id, target in self.new_rels:
+			etree.SubElement(root, f"{{{PKG_RELS_NS}}}Relationship", Id=rel_id, Type=REL_TYPE.IMAGE, Target=target)
+		self.zout.writestr(name, XML_DECLARATION + etree.tostring(root, encoding="unicode"))
+
+	def write_content_types(self):
+		name = "[Content_Types].xml"
+		root = etree.fromstring(self.compiled.members[name])
+		ns = root.nsmap[None]
+		known = {elt.get("Extension", "").lower() for elt in root.iterfind(f"{{{ns}}}Default")}
+		for media_name, data in self.media:
+			ext = posixpath.splitext(media_name)[1][1:].lower()
+			if ext not in known:
+				known.add(ext)
+				etree.SubElement(root, f"{{{ns}}}Default", Extension=ext, ContentType=f"image/{'jpeg' if ext == 'jpg' else ext}")
+		self.zout.writestr(name, XML_DECLARATION + etree.tostring(root, encoding="unicode"))
@@ -0,0 +1,42 @@
+import os
+import sys
+import glob
+import hashlib
+import logging
+import subprocess
+import importlib.util
+
+
+def compile_ui(ui_path, module_path):
+	# Même chose que pyside6-uic, sans dépendre du PATH.
+	tmp_path = f"{module_path}.{os.getpid()}.tmp"
+	subprocess.run(
+		[sys.executable, "-c", "from PySide6.scripts.pyside_tool import uic; uic()", ui_path, "-o", tmp_path],
+		check=True, capture_output=True
+	)
+	os.replace(tmp_path, module_path)
+
+def load_ui_class(ui_path, cache_dir="cache/ui"):
+	# Le code généré par uic est gardé en cache sous le hash du .ui, il n'est regénéré que si le .ui change.
+	with open(ui_path, "rb") as file:
+		digest = hashlib.sha1(file.read()).hexdigest()[:16]
+	name = os.path.splitext(os.path.basename(ui_path))[0]
+	module_path = os.path.join(cache_dir, f"ui_{name}_{digest}.py")
+	if not os.path.exists(module_path):
+		os.makedirs(cache_dir, exist_ok=True)
+		try:
+			compile_ui(ui_path, module_path)
+		except (OSError, subprocess.CalledProcessError) as e:
+			# Sans uic utilisable, on retombe sur la compilation à chaque démarrage.
+			logging.warning(f"Could not precompile {ui_path}, loading it at runtime: {e}")
+			from PySide6 import QtUiTools
+			return QtUiTools.loadUiType(ui_path)[0]
+		# Retirer les versions précédentes du même .ui.
+		for old_path in glob.glob(os.path.join(cache_dir, f"ui_{name}_*.py")):
+			if old_path != module_path:
+				os.remove(old_path)
+		logging.info(f"Precompiled {ui_path} to {module_path}")
+	spec = importlib.util.spec_from_file_location(f"ui_{name}", module_path)
+	module = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(module)
+	return next(cls for cls_name, cls in vars(module).items() if cls_name.startswith("Ui_"))
@@ -2,8 +2,6 @@ import os
 import logging
 import time
 
-from PySide6.QtCore import Qt
-
 
 def mkdir_if_not_there(*args, **kwargs):
 	try:
@@ -11,12 +9,6 @@ def mkdir_if_not_there(*args, **kwargs):
 	except FileExistsError:
 		pass
 
-def checkToBool(checkState):
-	return False if checkState == Qt.Unchecked else True
-
-def boolToCheck(boolean):
-	return Qt.Checked if boolean else Qt.Unchecked
-
 def clamp(val, lower, upper):
 	return min(max(val, lower), upper)
 
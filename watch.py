@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from eventbrite_manager import PrintStatus
+
+
+# Une cocarde qui échoue autant de fois de suite n'est plus retentée jusqu'au prochain démarrage.
+MAX_ATTEMPTS = 3
+# Quand le spool est plein, on revérifie s'il s'est vidé à cet intervalle (s).
+SPOOL_CHECK_INTERVAL = 1.0
+
+
+class WatchPipeline:
+	# Jour de l'événement : les nouvelles inscriptions passent directement de la synchro incrémentale au dossier spool,
+	# que surveille l'imprimante. Une cocarde est rendue dans spool/.partial, puis marquée imprimée et sauvegardée,
+	# puis seulement déplacée dans le spool. Après un plantage, recover() termine les déplacements interrompus.
+	def __init__(self, eventbrite, nametag_gen, spool_dir="spool", render_steps=[], max_spooled=100, batch_size=20, max_workers=None, overwrite_profiles=False):
+		self.eventbrite = eventbrite
+		self.nametag_gen = nametag_gen
+		self.spool_dir = spool_dir
+		self.partial_dir = os.path.join(spool_dir, ".partial")
+		self.render_steps = render_steps
+		self.max_spooled = max_spooled
+		self.batch_size = batch_size
+		self.max_workers = max_workers
+		self.overwrite_profiles = overwrite_profiles
+		self.in_flight = set()
+		self.failures = Counter()
+		# wakeup : un webhook ou stop() interrompt l'attente du prochain sondage.
+		self.wakeup = threading.Event()
+		self.stopped = threading.Event()
+		os.makedirs(self.partial_dir, exist_ok=True)
+
+	def filename(self, att_id):
+		return f"{att_id}_nametag.docx"
+
+	def spooled_count(self):
+		# Les cocardes que l'imprimante n'a pas encore prises.
+		return sum(1 for entry in os.scandir(self.spool_dir) if entry.is_file() and entry.name.endswith(".docx"))
+
+	def recover(self):
+		# Une cocarde partielle déjà marquée imprimée a été sauvegardée mais pas déplacée : on termine le déplacement.
+		# Les autres seront refaites, leur participant est encore non imprimé.
+		recovered = []
+		for name in os.listdir(self.partial_dir):
+			att = self.eventbrite.attendees.get(name.split("_", 1)[0])
+			if att is not None and att.printing_status == PrintStatus.PRINTED and name.endswith(".docx"):
+				recovered.append(att.attendee_id)
+			else:
+				os.remove(os.path.join(self.partial_dir, name))
+		self.publish(recovered)
+		if recovered:
+			logging.info(f"Recovered {len(recovered)} nametags that were generated but not spooled")
+		return recovered
+
+	def fetch(self):
+		# Réseau seulement, pour pouvoir rouler hors du fil du GUI. Tous les événements chargés, en mode multi-événements.
+		fetched = []
+		for event_id in self.eventbrite.events:
+			watermark = self.eventbrite.sync_watermarks.get(event_id)
+			fetched.append((event_id, self.eventbrite.download_attendees(changed_since=watermark, event_id=event_id), watermark))
+		return fetched
+
+	def merge(self, fetched):
+		for event_id, new_attendees, watermark in fetched:
+			self.eventbrite.merge_synced_attendees(new_attendees, self.overwrite_profiles, watermark, event_id)
+
+	def next_jobs(self):
+		# Seulement les personnes non imprimées, et pas plus que ce que le spool peut encore recevoir.
+		slots = min(self.batch_size, self.max_spooled - self.spooled_count())
+		if slots <= 0:
+			return []
+		jobs = []
+		eventbrite = self.eventbrite
+		for registrations in eventbrite.people():
+			if len(jobs) >= slots:
+				break
+			att_id = registrations[0].attendee_id
+			if eventbrite.person_status(registrations) != PrintStatus.UNPRINTED or att_id in self.in_flight or self.failures[att_id] >= MAX_ATTEMPTS:
+				continue
+			jobs.append((att_id, eventbrite.badge_data(registrations), os.path.join(self.partial_dir, self.filename(att_id))))
+		self.in_flight.update(job[0] for job in jobs)
+		return jobs
+
+	def render(self, jobs, cancelled=None):
+		# Pas de manifeste : les cocardes quittent .partial pour le spool, puis l'imprimante les retire.
+		# Un lot qui échoue en entier ne donne aucun résultat, commit() compte alors un échec pour chacune de ses cocardes.
+		try:
+			return self.nametag_gen.generate_nametags(jobs, self.render_steps, self.max_workers, cancelled=cancelled, skip_unchanged=False)
+		except Exception as e:
+			logging.error(f"Watch mode could not generate {len(jobs)} nametags: {e}")
+			return []
+
+	def commit(self, jobs, results):
+		# Marque imprimées les cocardes rendues, et toutes les inscriptions de leurs personnes. La session doit être
+		# sauvegardée avant publish(done). Retourne aussi tous les participants modifiés, pour la table.
+		done = []
+		for r in results:
+			if r.error is None and r.attendee_id in self.eventbrite.attendees:
+				self.failures.pop(r.attendee_id, None)
+				done.append(r.attendee_id)
+			else:
+				self.failures[r.attendee_id] += 1
+		# Sans résultat (lot en échec ou interrompu), la cocarde compte aussi comme un échec, sinon elle serait retentée sans fin.
+		rendered = {r.attendee_id for r in results}
+		for job in jobs:
+			if job[0] not in rendered:
+				self.failures[job[0]] += 1
+		changed = self.eventbrite.set_people_printing_status(done, PrintStatus.PRINTED)
+		self.in_flight.difference_update(job[0] for job in jobs)
+		return done, changed
+
+	def publish(self, att_ids):
+		# Le renommage est atomique, donc l'imprimante ne voit jamais de fichier à moitié écrit.
+		for att_id in att_ids:
+			name = self.filename(att_id)
+			os.replace(os.path.join(self.partial_dir, name), os.path.join(self.spool_dir, name))
+		if att_ids:
+			logging.info(f"Spooled {len(att_ids)} nametags ({self.spooled_count()} waiting for the printer)")
+
+	def run(self, save, poll_interval=30):
+		# Boucle du mode sans interface. save() sauvegarde la session, elle est appelée avant chaque publication.
+		self.recover()
+		next_poll = 0
+		while not self.stopped.is_set():
+			if self.wakeup.is_set() or time.monotonic() >= next_poll:
+				self.wakeup.clear()
+				try:
+					self.merge(self.fetch())
+					# Le nouveau filigrane et les nouveaux participants sont sauvegardés même si rien n'est à imprimer.
+					save()
+				except Exception as e:
+					# Une panne réseau n'arrête pas l'impression de ce qui est déjà connu.
+					logging.warning(f"Could not sync attendees, retrying in {poll_interval} s: {e}")
+				next_poll = time.monotonic() + poll_interval
+			jobs = self.next_jobs()
+			if jobs:
+				done, changed = self.commit(jobs, self.render(jobs, self.stopped.is_set))
+				save()
+				self.publish(done)
+				continue
+			# Rien à faire ou spool plein : attendre le prochain sondage, un webhook ou que l'imprimante prenne des cocardes.
+			self.wakeup.wait(max(0, min(SPOOL_CHECK_INTERVAL, next_poll - time.monotonic())))
+
+	def stop(self):
+		self.stopped.set()
+		self.wakeup.set()
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+	def log_message(self, format, *args):
+		logging.debug(f"Webhook {self.address_string()}: {format % args}")
+
+	def do_POST(self):
+		# Eventbrite envoie seulement l'action et l'URL de l'objet modifié : on déclenche une synchro incrémentale.
+		length = int(self.headers.get("Content-Length") or 0)
+		try:
+			payload = json.loads(self.rfile.read(length) or b"{}")
+			action = payload.get("config", {}).get("action", "unknown")
+		except (ValueError, AttributeError):
+			self.send_response(400)
+			self.end_headers()
+			return
+		logging.info(f"Webhook received: {action}")
+		self.server.pipeline.wakeup.set()
+		self.send_response(200)
+		self.end_headers()
+
+
+class WebhookServer(ThreadingHTTPServer):
+	daemon_threads = True
+
+	def __init__(self, pipeline, host="127.0.0.1", port=8765):
+		super().__init__((host, port), WebhookHandler)
+		self.pipeline = pipeline
+
+	def start(self):
+		threading.Thread(target=self.serve_forever, name="watch-webhook", daemon=True).start()
+		logging.info(f"Listening for Eventbrite webhooks on {self.server_address[0]}:{self.server_address[1]}")
+		return self
+
+	def stop(self):
+		self.shutdown()
+		self.server_close()